@@ -1,7 +1,9 @@
 from django.contrib import admin
 from core.models.currency import Currency
 from core.models.currency_exchange_rate import CurrencyExchangeRate
+from core.models.currency_exchange_rate_rollup import CurrencyExchangeRateRollup
 from core.models.providers import Providers  # Import the Providers model
+from core.models.backfill_checkpoint import BackfillCheckpoint
 
 class CurrencyAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'symbol', 'load_historical_data')  # Include the flag in list display
@@ -24,9 +26,15 @@ class CurrencyExchangeRateAdmin(admin.ModelAdmin):
     search_fields = ('source_currency__code', 'exchanged_currency__code')
     list_filter = ('valuation_date', 'source_currency', 'exchanged_currency')
     ordering = ('valuation_date', 'source_currency')
+
+class CurrencyExchangeRateRollupAdmin(admin.ModelAdmin):
+    list_display = ('source_currency', 'exchanged_currency', 'resolution', 'period_start', 'open_value', 'high_value', 'low_value', 'close_value', 'mean_value', 'days')
+    search_fields = ('source_currency__code', 'exchanged_currency__code')
+    list_filter = ('resolution', 'exchanged_currency')
+    ordering = ('period_start', 'exchanged_currency')
     
 class ProvidersAdmin(admin.ModelAdmin):
-    list_display = ('provider_name', 'provider_url', 'is_active', 'priority')  # Display fields in the list view
+    list_display = ('provider_name', 'provider_url', 'is_active', 'priority', 'requests_per_second', 'daily_quota')  # Display fields in the list view
     search_fields = ('provider_name',)  # Add search functionality for provider_name
     list_filter = ('is_active',)  # Add a filter for is_active
     ordering = ('priority',)  # Order by priority
@@ -43,10 +51,17 @@ class ProvidersAdmin(admin.ModelAdmin):
             return ['provider_url']  # Make provider_url field read-only on edit
         return super().get_readonly_fields(request, obj)
 
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('key', 'start_date', 'completed_through', 'updated_at')
+    search_fields = ('key',)
+    ordering = ('key',)
+
 # Register the Providers model with the custom admin class
 admin.site.register(Currency, CurrencyAdmin)
 admin.site.register(CurrencyExchangeRate, CurrencyExchangeRateAdmin)
+admin.site.register(CurrencyExchangeRateRollup, CurrencyExchangeRateRollupAdmin)
 admin.site.register(Providers, ProvidersAdmin)
+admin.site.register(BackfillCheckpoint, BackfillCheckpointAdmin)
 
 
 
@@ -0,0 +1,16 @@
+from django.core import checks
+
+from core.services.shared_cache import process_local_settings
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """Warn when caches that must be shared by every worker resolve to a per-process backend."""
+    return [
+        checks.Warning(
+            f"{name}['ALIAS'] uses a per-process cache backend: {consequence}.",
+            hint="Set REDIS_URL so the 'shared' cache alias uses Redis.",
+            id="core.W001",
+        )
+        for name, consequence in process_local_settings().items()
+    ]
@@ -1,17 +1,33 @@
 import traceback
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from core.models import Currency
 from core.serializers.currency_serializer import CurrencySerializer
+from core.serializers.json_stream import stream_json_array, wants_stream
+from core.services.currency_list_cache import currency_list_cache
 
 
 class CurrencyDataController:
-    def load_currency_data(request):
+    async def load_currency_data(request):
         if request.method == "GET":
             try:
-                queryset = Currency.objects.all()
-                serializer_class = CurrencySerializer(queryset, many=True)
-                return JsonResponse(serializer_class.data, safe=False, status=200)
+                if wants_stream(request):
+                    # Serializer fields read straight off a chunked cursor, written as they arrive
+                    rows = Currency.objects.values(*CurrencySerializer.Meta.fields).order_by('id').aiterator(chunk_size=settings.STREAMING['CHUNK_SIZE'])
+                    return StreamingHttpResponse(stream_json_array(rows), content_type='application/json')
+                # Prebuilt body and validators, a repeat visit is answered with 304 and never touches the database
+                entry = await currency_list_cache.aget()
+                response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+                if response is None:
+                    response = HttpResponse(entry['body'], content_type='application/json', status=200)
+                response['ETag'] = entry['etag']
+                response['Last-Modified'] = http_date(entry['last_modified'])
+                # Always revalidate; the list can change whenever currencies are loaded
+                patch_cache_control(response, no_cache=True)
+                return response
             except Exception as e:
                 print("Error loading currency data:", e)
                 traceback.print_exc()
-                return JsonResponse({'error': 'Failed to load currency data'}, status=500)
\ No newline at end of file
+                return JsonResponse({'error': 'Failed to load currency data'}, status=500)
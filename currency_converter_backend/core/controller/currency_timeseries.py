@@ -1,15 +1,25 @@
 import json
 import traceback
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
+from core.http_cache import patch_rate_cache_headers
+from core.serializers.json_stream import wants_stream
+from core.serializers.timeseries_serializer import JSON_CONTENT_TYPE, negotiate_format, stream_rows_payload, timeseries_response
 from core.services.currency_timeseries_service import CurrencyTimeseriesService
+from core.services.rate_store import period_end, period_start
 from datetime import datetime
 
 class CurrencyTimeseriesController:
     @csrf_exempt
-    def multiple_currency_timeseries(request):
-        if request.method == "POST":
-            json_data = json.loads(request.body.decode('utf-8'))
+    async def multiple_currency_timeseries(request):
+        if request.method in ("GET", "POST"):
+            if request.method == "POST":
+                json_data = json.loads(request.body.decode('utf-8'))
+            else:
+                # Cacheable GET form: ?base_currency=USD&to_currencies=EUR,GBP&start_date=...&end_date=...
+                json_data = request.GET.dict()
+                json_data['to_currencies'] = [code for value in request.GET.getlist('to_currencies') for code in value.split(',') if code]
             print("multiple_currency_timeseries Request Data", json_data)
             try:
                 base_currency_code = json_data.get('base_currency')
@@ -23,8 +33,30 @@ class CurrencyTimeseriesController:
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-                results = CurrencyTimeseriesService.fetch_currency_timeseries(base_currency_code, to_currencies, start_date, end_date)
-                return JsonResponse(results)
+                # daily / weekly / monthly, or the finest one that fits max_points
+                try:
+                    resolution = CurrencyTimeseriesService.choose_resolution(start_date, end_date, json_data.get('resolution'), int(json_data.get('max_points') or 0))
+                except ValueError as e:
+                    return JsonResponse({"error": str(e)}, status=400)
+
+                if wants_stream(request) and resolution == CurrencyTimeseriesService.DAILY and negotiate_format(request) == JSON_CONTENT_TYPE:
+                    # Rows written as they are read, so memory and time to first byte don't grow with the range
+                    stream = await CurrencyTimeseriesService.stream_currency_timeseries(base_currency_code, to_currencies, start_date, end_date)
+                    if isinstance(stream, tuple):
+                        return JsonResponse(stream[0], status=stream[1])
+                    response = StreamingHttpResponse(stream_rows_payload(**stream), content_type=JSON_CONTENT_TYPE)
+                    patch_vary_headers(response, ["Accept"])
+                    return patch_rate_cache_headers(response, end_date, cacheable=not stream["errors"])
+
+                frame = await CurrencyTimeseriesService.load_currency_timeseries(base_currency_code, to_currencies, start_date, end_date, resolution)
+                if isinstance(frame, tuple):
+                    # Validation errors come back as (payload, status)
+                    return JsonResponse(frame[0], status=frame[1])
+                # Rows, columnar JSON or MessagePack depending on the Accept header
+                response = timeseries_response(request, frame)
+                # A rollup's last period keeps changing until it ends, so it counts as covering its last day
+                last_date = end_date if resolution == CurrencyTimeseriesService.DAILY else period_end(period_start(end_date, resolution), resolution)
+                return patch_rate_cache_headers(response, last_date, cacheable=not frame["errors"])
 
             except Exception as e:
                 print("multiple_currency_timeseries : Error loading currency data:", e)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import traceback
 from asgiref.sync import sync_to_async
@@ -6,8 +7,11 @@ from django.conf import settings
 from django.http import JsonResponse
 from django.db import IntegrityError
 from django.views.decorators.csrf import csrf_exempt
-from core.models import CurrencyExchangeRate, Currency
-from core.services.exchange_rate_service import get_exchange_rate_data
+from core.http_cache import patch_rate_cache_headers
+from core.models import Currency
+from core.services.exchange_rate_service import ProviderUnavailableError, convert_amount, provider_chain
+from core.services.rate_cache import rate_cache
+from core.services.rate_engine import RateEngine
 
 class ExchangeRateController:
     @csrf_exempt
@@ -15,68 +19,98 @@ class ExchangeRateController:
         if request.method == "POST":
             json_data = json.loads(request.body.decode('utf-8'))
             try:
-                source_currency_code = json_data.get('source_currency', 'USD')
-                exchanged_currencies = json_data.get('exchanged_currencies', ['EUR'])
-                valuation_date = json_data.get('valuation_date', '2024-01-01')
-                provider = json_data.get('provider', settings.CURRENT_PROVIDER)
-                amount = json_data.get('amount', '1')
-                results = {}
+                return await ExchangeRateController.conversion_response(
+                    json_data.get('source_currency', 'USD'),
+                    json_data.get('exchanged_currencies', ['EUR']),
+                    json_data.get('valuation_date', '2024-01-01'),
+                    json_data.get('provider', settings.CURRENT_PROVIDER),
+                    json_data.get('amount', '1'),
+                )
+            except Exception as e:
+                print("Error loading currency data:", e)
+                traceback.print_exc()
+                return JsonResponse({'error': 'Failed to load currency data'}, status=500)
+        else:
+            return JsonResponse({"error": "Invalid HTTP method"}, status=405)
+
+    async def convert_currency(request):
+        """Cacheable GET form of convert_multiple_currency: ?source_currency=USD&exchanged_currencies=EUR,GBP&valuation_date=...&amount=..."""
+        if request.method == "GET":
+            try:
+                exchanged_currencies = [code for value in request.GET.getlist('exchanged_currencies', ['EUR']) for code in value.split(',') if code]
+                return await ExchangeRateController.conversion_response(
+                    request.GET.get('source_currency', 'USD'),
+                    exchanged_currencies,
+                    request.GET.get('valuation_date', '2024-01-01'),
+                    request.GET.get('provider', settings.CURRENT_PROVIDER),
+                    request.GET.get('amount', '1'),
+                )
+            except Exception as e:
+                print("Error loading currency data:", e)
+                traceback.print_exc()
+                return JsonResponse({'error': 'Failed to load currency data'}, status=500)
+        else:
+            return JsonResponse({"error": "Invalid HTTP method"}, status=405)
 
-                # Fetch the source currency instance
-                source_currency = await sync_to_async(Currency.objects.get)(code=source_currency_code)
+    @staticmethod
+    async def conversion_response(source_currency_code, exchanged_currencies, valuation_date, provider, amount):
+        results = await ExchangeRateController.convert(source_currency_code, list(dict.fromkeys(exchanged_currencies)), valuation_date, provider, amount)
+        response = JsonResponse(results, status=200)
+        # Past-date conversions are immutable unless a target failed and should be retried
+        return patch_rate_cache_headers(response, datetime.strptime(valuation_date, '%Y-%m-%d').date(), cacheable=not any("error" in result for result in results.values()))
 
-                for exchanged_currency_code in exchanged_currencies:
-                    # Attempt to get the rate from the database first
-                    rate_entry = await sync_to_async(list)(
-                        CurrencyExchangeRate.objects.filter(
-                            source_currency=source_currency,
-                            exchanged_currency__code=exchanged_currency_code,
-                            valuation_date=valuation_date
-                        )
-                    )  # Convert queryset to a list and await
+    @staticmethod
+    async def convert(source_currency_code, exchanged_currencies, valuation_date, provider, amount):
+        results = {}
 
-                    if rate_entry:
-                        rate = rate_entry[0].rate_value  # Access the first element if available
-                        print("FETCHED FROM DB")
-                        results[exchanged_currency_code] = {
-                            "rate": rate,
-                            "converted_amount": round(float(rate) * float(amount), 3),
-                            "fetched_from": f"Database ({valuation_date})"
-                        }
-                    else:
-                        try:
-                            # Fetch the rate from the external API
-                            rate = await get_exchange_rate_data(source_currency_code, exchanged_currency_code, amount, valuation_date, provider)
-                            
-                            # Fetch the exchanged currency instance
-                            exchanged_currency = await sync_to_async(Currency.objects.get)(code=exchanged_currency_code)
+        # Fetch the source currency instance
+        source_currency = await sync_to_async(Currency.objects.get)(code=source_currency_code)
 
-                            # Save the rate data to the database
-                            currency_exchange_rate = CurrencyExchangeRate(
-                                source_currency=source_currency,
-                                exchanged_currency=exchanged_currency,
-                                valuation_date=valuation_date,
-                                rate_value=rate
-                            )
-                            await sync_to_async(currency_exchange_rate.save)()  # Save the entry
+        # Every pair is derived from the pivot rates of its two legs
+        pivot_rates, origins, errors = await RateEngine.aresolve_pivot_rates(RateEngine.pivot_codes(source_currency.code, *exchanged_currencies), valuation_date, provider)
 
-                            results[exchanged_currency_code] = {
-                                "rate": rate,
-                                "converted_amount": float(rate) * float(amount),
-                                "fetched_from": f'API ({datetime.now().strftime("%Y-%m-%d")})'
-                            }
-                        except ValueError as e:
-                            results[exchanged_currency_code] = {"error": str(e)}
-                        except IntegrityError:
-                            results[exchanged_currency_code] = {"error": "Rate already exists for this currency pair on this date."}
-                        except Exception as e:
-                            results[exchanged_currency_code] = {"error": "An error occurred while fetching the rate."}
+        for exchanged_currency_code in exchanged_currencies:
+            legs = RateEngine.pivot_codes(source_currency.code, exchanged_currency_code)
+            failed_legs = [code for code in legs if code in errors]
+            if failed_legs:
+                results[exchanged_currency_code] = ExchangeRateController.error_result(errors[failed_legs[0]])
+                continue
 
-                return JsonResponse(results, status=200)
+            rate = RateEngine.cross_rate(pivot_rates, source_currency.code, exchanged_currency_code)
+            leg_origins = {origins[code] for code in legs}
+            if "API" in leg_origins:
+                fetched_from = f'API ({datetime.now().strftime("%Y-%m-%d")})'
+            elif "Database" in leg_origins:
+                fetched_from = f"Database ({valuation_date})"
+            else:
+                fetched_from = f"Cache ({valuation_date})"
+            results[exchanged_currency_code] = {
+                "rate": rate,
+                "converted_amount": float(convert_amount(rate, amount)),
+                "fetched_from": fetched_from
+            }
+        return results
 
-            except Exception as e:
-                print("Error loading currency data:", e)
-                traceback.print_exc()
-                return JsonResponse({'error': 'Failed to load currency data'}, status=500)
+    @staticmethod
+    def error_result(error):
+        if isinstance(error, asyncio.TimeoutError):
+            return {"error": "Timed out while fetching the rate."}
+        if isinstance(error, ProviderUnavailableError):
+            return {"error": "No exchange rate provider is available right now."}
+        if isinstance(error, IntegrityError):
+            return {"error": "Rate already exists for this currency pair on this date."}
+        if isinstance(error, ValueError):
+            return {"error": str(error)}
+        return {"error": "An error occurred while fetching the rate."}
+
+    def rate_cache_stats(request):
+        if request.method == "GET":
+            return JsonResponse(rate_cache.stats(), status=200)
+        else:
+            return JsonResponse({"error": "Invalid HTTP method"}, status=405)
+
+    async def provider_status(request):
+        if request.method == "GET":
+            return JsonResponse({"providers": await provider_chain.status(), "hedging": {"enabled": provider_chain.hedging, **provider_chain.hedge_budget.snapshot()}}, status=200)
         else:
             return JsonResponse({"error": "Invalid HTTP method"}, status=405)
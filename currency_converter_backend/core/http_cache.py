@@ -0,0 +1,19 @@
+from datetime import date
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+
+
+def patch_rate_cache_headers(response, last_valuation_date, cacheable=True):
+    """
+    Rates of past dates never change once stored, so responses covering only past dates are public and
+    immutable for ``HTTP_CACHE['PAST_MAX_AGE']``. Anything reaching today gets ``TODAY_MAX_AGE``, and
+    responses that carry an error (timeouts, provider failures) are never cached.
+    """
+    if not cacheable:
+        patch_cache_control(response, no_cache=True, max_age=0)
+    elif last_valuation_date < date.today():
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE["PAST_MAX_AGE"], immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE["TODAY_MAX_AGE"])
+    return response
@@ -0,0 +1,38 @@
+import logging
+
+from core.services.provider_http import provider_http
+from core.services.shared_cache import process_local_settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def with_lifespan(django_application):
+    """
+    Wrap the Django ASGI application with an ASGI lifespan handler.
+
+    Django only speaks HTTP, so the lifespan protocol is answered here. Startup
+    warns when caches meant to be shared by every worker are per-process (ASGI
+    servers don't run the system checks), and the shared provider connection
+    pools are closed when the server shuts down.
+    """
+
+    async def application(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await django_application(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                for name, consequence in process_local_settings().items():
+                    logger.warning(f"{name}['ALIAS'] uses a per-process cache backend: {consequence}. Set REDIS_URL to share it.")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await provider_http.aclose()
+                except Exception as e:
+                    logger.error(f"Error closing provider HTTP clients: {e}")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return application
@@ -1,149 +1,361 @@
+import hashlib
 import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from core.models.backfill_checkpoint import BackfillCheckpoint
 from core.models.currency import Currency
-from core.models.currency_exchange_rate import CurrencyExchangeRate
 from channels.db import database_sync_to_async
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from core.models.providers import Providers
+from core.services.exchange_rate_service import build_provider, quota_limits
+from core.services.provider_http import provider_http
+from core.services.provider_quota import BATCH, provider_quota
+from core.services.rate_engine import RateEngine
+from core.services.rate_store import find_missing_dates, load_currency_ids, upsert_exchange_rates
+from core.services.rate_limiter import RETRYABLE_STATUS_CODES, AsyncRateLimiter, backoff_delay
+from django.conf import settings
 import asyncio
-import aiohttp
+import httpx
 import logging
 from asgiref.sync import sync_to_async
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+def plan_windows(dates, max_days):
+    """
+    Group sorted ``dates`` into the fewest windows spanning at most ``max_days`` days each.
+    Returns ``[(window_start, window_end, dates_in_window)]``.
+    """
+    windows = []
+    for valuation_date in dates:
+        if windows and (valuation_date - windows[-1][0]).days < max_days:
+            windows[-1][1] = valuation_date
+            windows[-1][2].append(valuation_date)
+        else:
+            windows.append([valuation_date, valuation_date, [valuation_date]])
+    return [tuple(window) for window in windows]
+
+
+class BackfillProgress:
+    """
+    Tracks which planned dates have been stored and advances ``completed_through``
+    over the contiguous prefix, so the checkpoint never skips a date that failed.
+    """
+
+    def __init__(self, planned_dates, end_date, completed_through):
+        self.planned_dates = sorted(planned_dates)
+        self.end_date = end_date
+        self.completed_through = completed_through
+        self.done = set()
+        self.index = 0
+
+    def mark_done(self, dates):
+        """Record stored dates; returns True when ``completed_through`` moved forward."""
+        self.done.update(dates)
+        while self.index < len(self.planned_dates) and self.planned_dates[self.index] in self.done:
+            self.index += 1
+        if self.index == len(self.planned_dates):
+            completed_through = self.end_date
+        else:
+            completed_through = self.planned_dates[self.index] - timedelta(days=1)
+        if completed_through > self.completed_through:
+            self.completed_through = completed_through
+            return True
+        return False
+
+
 class Command(BaseCommand):
     help = 'Load historical currency exchange rate data'
 
-    async def fetch_exchange_rate(self, session, url, base_currency, symbols, date):
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, default=parse_date(settings.HISTORICAL_LOAD['DEFAULT_START']), help='First date to load (YYYY-MM-DD)')
+        parser.add_argument('--end', type=parse_date, default=date.today(), help='Last date to load (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--currencies', help='Comma-separated currency codes, defaults to currencies flagged with load_historical_data')
+        parser.add_argument('--provider', help='Only use this provider instead of every active provider in priority order')
+        parser.add_argument('--ignore-checkpoint', action='store_true', help='Re-check the whole range instead of resuming after the last checkpoint')
+        parser.add_argument('--concurrency', type=int, default=settings.HISTORICAL_LOAD['CONCURRENCY'], help='Maximum number of requests in flight')
+        parser.add_argument('--rate', type=float, default=settings.HISTORICAL_LOAD['REQUESTS_PER_SECOND'], help='Maximum requests per second per provider (0 disables the limit)')
+        parser.add_argument('--batch-size', type=int, default=settings.HISTORICAL_LOAD['BATCH_SIZE'], help='Rates written per bulk upsert')
+        parser.add_argument('--retries', type=int, default=settings.HISTORICAL_LOAD['MAX_RETRIES'], help='Retries per request on 429/5xx responses and network errors')
+
+    async def get_json(self, client, url, description):
+        """
+        GET ``url`` through the rate limiter and the provider's shared quota, retrying 429/5xx responses and
+        network errors with backoff. The quota waits for a slot left over by interactive traffic. Any other
+        non-2xx response raises ``httpx.HTTPStatusError``, its body is an error document rather than rates.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            await provider_quota.acquire(self.provider_name, priority=BATCH, **self.quota_limits)
+            self.stats['requests'] += 1
+            try:
+                response = await client.get(url)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, settings.HISTORICAL_LOAD['BACKOFF_BASE'], settings.HISTORICAL_LOAD['BACKOFF_MAX'])
+                logger.warning(f"Network error for {description} ({e}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                delay = backoff_delay(attempt, settings.HISTORICAL_LOAD['BACKOFF_BASE'], settings.HISTORICAL_LOAD['BACKOFF_MAX'], response.headers.get('Retry-After'))
+                logger.warning(f"HTTP {response.status_code} for {description}, retrying in {delay:.2f}s")
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def response_data(data):
+        """The ``response`` object of a provider answer; anything else (e.g. an error document) is not a day without rates."""
+        response_data = data.get('response') if isinstance(data, dict) else None
+        if not isinstance(response_data, dict):
+            raise ValueError("Unexpected API response format")
+        return response_data
+
+    @staticmethod
+    def build_rates(base_currency, symbols, date, rates):
+        return [
+            {"source_currency": base_currency, "exchanged_currency": symbol, "valuation_date": date, "rate_value": rates[symbol]}
+            for symbol in symbols.split(',') if rates.get(symbol) is not None
+        ]
+
+    async def fetch_exchange_rate(self, client, url, base_currency, symbols, date):
+        """Returns the day's rates, ``[]`` when the provider has none and ``None`` when the request failed."""
         logger.debug(f"Fetching exchange rates from {url} for {base_currency} to {symbols} on {date}...")
         try:
-            async with session.get(url) as response:
-                data = await response.json()
-                logger.debug(f"Raw response for {base_currency} to {symbols} on {date}: {data}")
-
-                # Extract the rates from the correct part of the response
-                response_data = data.get('response', {})
-                rates = response_data.get('rates', {})
-
-                # Check if rates exist for the requested symbols
-                if not rates:
-                    logger.warning(f"No rates found for {base_currency} on {date}.")
-                    return []
-
-                # Construct the exchange rate dictionary
-                exchange_rate = []
-                for symbol in symbols.split(','):
-                    if symbol in rates:
-                        exchange_rate.append({
-                            "source_currency": base_currency,
-                            "exchanged_currency": symbol,
-                            "valuation_date": date,
-                            "rate_value": rates[symbol]
-                        })
-                        logger.info(f"Rate found: {base_currency} to {symbol} on {date}: {rates[symbol]}")
-
-                return exchange_rate
+            data = await self.get_json(client, url, f"{base_currency} on {date}")
+            logger.debug(f"Raw response for {base_currency} to {symbols} on {date}: {data}")
+
+            # Extract the rates from the correct part of the response
+            rates = self.response_data(data).get('rates') or {}
+
+            # Check if rates exist for the requested symbols
+            if not rates:
+                logger.warning(f"No rates found for {base_currency} on {date}.")
+                return []
+
+            # Construct the exchange rate dictionary
+            exchange_rate = self.build_rates(base_currency, symbols, date, rates)
+            logger.debug(f"Rates found for {base_currency} on {date}: {len(exchange_rate)}")
+
+            return exchange_rate
 
         except Exception as e:
-            logger.error(f"An error occurred while fetching exchange rates for {base_currency}: {e}")
-            return []
+            self.stats['failures'] += 1
+            logger.error(f"An error occurred while fetching exchange rates for {base_currency} on {date}: {e}")
+            return None
 
-    async def save_data(self, exchange_data):
-        if not exchange_data:
-            logger.info("No exchange data to save.")
-            return
+    async def fetch_exchange_rate_window(self, client, url, base_currency, symbols, window_dates):
+        """
+        Fetch a whole window from the provider's range endpoint in one call.
+        Returns ``{date: rates}`` for the requested days (``[]`` for days without rates), or ``None`` when the request failed.
+        """
+        logger.debug(f"Fetching exchange rates from {url} for {base_currency} to {symbols} from {window_dates[0]} to {window_dates[-1]}...")
+        try:
+            data = await self.get_json(client, url, f"{base_currency} from {window_dates[0]} to {window_dates[-1]}")
+            # The range endpoint keys the rates by date
+            rates_by_date = self.response_data(data)
+            return {valuation_date: self.build_rates(base_currency, symbols, valuation_date, rates_by_date.get(valuation_date.isoformat()) or {}) for valuation_date in window_dates}
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"An error occurred while fetching exchange rates for {base_currency} from {window_dates[0]} to {window_dates[-1]}: {e}")
+            return None
 
-        logger.info(f"Preparing to save {len(exchange_data)} exchange rates...")
+    async def save_checkpoint(self):
+        await database_sync_to_async(BackfillCheckpoint.objects.update_or_create)(
+            key=self.checkpoint_key,
+            defaults={'start_date': self.start_date, 'completed_through': self.progress.completed_through}
+        )
 
-        @database_sync_to_async
-        def create_or_update_exchange_rates(data):
-            for item in data:
-                source_currency = Currency.objects.get(code=item["source_currency"])
-                exchanged_currency = Currency.objects.get(code=item["exchanged_currency"])
+    async def save_data(self, queue, batch_size):
+        """
+        Drain ``(date, rates)`` items from ``queue`` and write them in batches of at least ``batch_size``
+        rates, rounded up to whole days, until a ``None`` sentinel arrives. The checkpoint moves after
+        every batch.
+        """
+        currency_ids = await database_sync_to_async(load_currency_ids)()
+        write_batch = database_sync_to_async(upsert_exchange_rates)
+        batch, batch_dates = [], []
 
-                # Use get_or_create to handle the case of both creation and updating
-                exchange_rate, created = CurrencyExchangeRate.objects.update_or_create(
-                    source_currency=source_currency,
-                    exchanged_currency=exchanged_currency,
-                    valuation_date=item["valuation_date"],
-                    defaults={'rate_value': item["rate_value"]}
-                )
+        async def flush():
+            saved = await write_batch(batch, currency_ids)
+            self.stats['saved'] += saved
+            logger.info(f'Saved batch of {saved} exchange rates.')
+            if self.progress.mark_done(batch_dates):
+                await self.save_checkpoint()
+            batch.clear()
+            batch_dates.clear()
 
-                if created:
-                    logger.info(f"Created new exchange rate: {exchange_rate}")
-                else:
-                    logger.info(f"Updated exchange rate: {exchange_rate}")
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            valuation_date, exchange_rate = item
+            batch.extend((rate["source_currency"], rate["exchanged_currency"], rate["valuation_date"], rate["rate_value"]) for rate in exchange_rate)
+            batch_dates.append(valuation_date)
+            if len(batch) >= batch_size:
+                await flush()
 
-        await create_or_update_exchange_rates(exchange_data)
-        logger.info(f'Saved {len(exchange_data)} exchange rates.')
+        if batch:
+            await flush()
 
-    async def load_exchange_rates(self):
+    async def load_exchange_rates(self, options):
         logger.info("Loading exchange rates...")
+        self.max_retries = options['retries']
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'rates': 0, 'saved': 0, 'checkpointed_days': 0, 'stored_days': 0}
+        self.start_date, end_date = options['start'], options['end']
+        if self.start_date > end_date:
+            raise CommandError("--start must not be after --end.")
 
-        # Fetch active providers asynchronously
-        active_providers = await sync_to_async(lambda: list(Providers.objects.filter(is_active=True).order_by('priority')))()
+        # Fetch the requested provider, or every active provider in priority order
+        providers = Providers.objects.filter(is_active=True).order_by('priority')
+        if options['provider']:
+            providers = providers.filter(provider_name=options['provider'])
+        active_providers = await sync_to_async(list)(providers)
+        if not active_providers:
+            raise CommandError(f"No active provider named '{options['provider']}'." if options['provider'] else "No active providers.")
         logger.info(f"Active providers fetched: {len(active_providers)}")
 
-        # Fetch currencies with load_historical_data=True
-        currencies = await sync_to_async(lambda: list(Currency.objects.filter(load_historical_data=True)))()
-        
-        # Extract currency codes
-        currencies = [currency.code for currency in currencies]
+        # Fetch the requested currencies, or those with load_historical_data=True
+        if options['currencies']:
+            currencies = [code.strip().upper() for code in options['currencies'].split(',') if code.strip()]
+        else:
+            currencies = await sync_to_async(lambda: list(Currency.objects.filter(load_historical_data=True).values_list('code', flat=True)))()
         logger.info(f"Currencies selected for loading historical data: {currencies}")
 
-        start_date = datetime(2024, 9, 1)  # CHANGE DATE TO LOAD THE DATA
-        end_date = datetime.now()
-        delta = timedelta(days=1)
+        # Only pivot rows are stored, every other pair is derived by the rate engine
+        base_currency = RateEngine.pivot
+        target_codes = RateEngine.pivot_codes(*currencies)
+        if not target_codes:
+            logger.info("No currencies to load.")
+            return
+        symbols = ','.join(target_codes)
 
-        dates = []
-        while start_date <= end_date:
-            dates.append(start_date.strftime('%Y-%m-%d'))
-            start_date += delta
-        logger.info(f"Date range for exchange rates: {len(dates)} days from {dates[0]} to {dates[-1]}.")
+        # Resume after the last checkpoint of the same provider/pivot/currency set when it covers our start
+        self.checkpoint_key = f"{options['provider'] or 'active'}:{base_currency}:{hashlib.sha1(symbols.encode()).hexdigest()[:16]}"
+        checkpoint = await sync_to_async(BackfillCheckpoint.objects.filter(key=self.checkpoint_key).first)()
+        scan_start = self.start_date
+        if checkpoint and not options['ignore_checkpoint'] and checkpoint.start_date <= self.start_date <= checkpoint.completed_through:
+            scan_start = checkpoint.completed_through + timedelta(days=1)
+            logger.info(f"Resuming after checkpoint {checkpoint.completed_through}.")
 
-        async with aiohttp.ClientSession() as session:
-            exchange_data = []
+        # Only fetch the days that are not fully stored yet
+        dates = await database_sync_to_async(find_missing_dates)(base_currency, target_codes, scan_start, end_date) if scan_start <= end_date else []
+        self.progress = BackfillProgress(dates, end_date, scan_start - timedelta(days=1))
+        self.stats['checkpointed_days'] = (min(scan_start, end_date + timedelta(days=1)) - self.start_date).days
+        self.stats['stored_days'] = max(0, (end_date - scan_start).days + 1) - len(dates)
+        if not dates:
+            logger.info(f"Nothing to load between {self.start_date} and {end_date}.")
+            if self.progress.mark_done([]):
+                await self.save_checkpoint()
+            return
+        logger.info(f"Date range for exchange rates: {len(dates)} missing days between {dates[0]} and {dates[-1]}.")
 
-            # Try fetching from each provider
+        # Fetched rates stream through a bounded queue into the batch writer, so memory stays
+        # flat however long the date range is and every written batch survives a crash
+        queue = asyncio.Queue(maxsize=options['concurrency'] * 2)
+        writer = asyncio.create_task(self.save_data(queue, options['batch_size']))
+        fetched_dates, empty_dates = set(), set()
+
+        try:
+            # Try fetching from each provider, handing the days still missing to the next one
             for provider in active_providers:
-                logger.info(f'Trying provider: {provider.provider_name}')
+                remaining_dates = [valuation_date for valuation_date in dates if valuation_date not in fetched_dates]
+                if not remaining_dates:
+                    break
+
+                logger.info(f'Trying provider: {provider.provider_name} for {len(remaining_dates)} days')
+                client = provider_http.get_async_client(provider.provider_name)
+                self.limiter = AsyncRateLimiter(options['rate'])
+                self.provider_name, self.quota_limits = provider.provider_name, quota_limits(provider)
+                semaphore = asyncio.Semaphore(options['concurrency'])
                 if provider.provider_name == "CurrencyBeacon":
                     url_template = f'{provider.provider_url}historical?api_key={provider.credentials["api-key"]}&base={{}}&symbols={{}}&date={{}}'
                 else:
                     url_template = f'{provider.provider_url}historical?access_key={provider.credentials["api-key"]}&base={{}}&symbols={{}}&date={{}}'
 
-                for base_currency in currencies:
-                    exchanged_currencies = [currency for currency in currencies if currency != base_currency]
-                    symbols = ','.join(exchanged_currencies)
+                async def store(valuation_date, exchange_rate):
+                    if exchange_rate:
+                        fetched_dates.add(valuation_date)
+                        self.stats['rates'] += len(exchange_rate)
+                        await queue.put((valuation_date, exchange_rate))
+                    elif exchange_rate == []:
+                        empty_dates.add(valuation_date)
 
-                    for date in dates:
-                        url = url_template.format(base_currency, symbols, date)
-                        logger.debug(f"Generated URL for {base_currency} to {symbols} on {date}: {url}")
-                        exchange_rate = await self.fetch_exchange_rate(session, url, base_currency, symbols, date)
-                        if exchange_rate:
-                            exchange_data.extend(exchange_rate)
+                async def fetch(valuation_date):
+                    async with semaphore:
+                        url = url_template.format(base_currency, symbols, valuation_date.isoformat())
+                        logger.debug(f"Generated URL for {base_currency} to {symbols} on {valuation_date}: {url}")
+                        exchange_rate = await self.fetch_exchange_rate(client, url, base_currency, symbols, valuation_date)
+                    await store(valuation_date, exchange_rate)
 
-                if exchange_data:  # If we successfully fetched data, break out of the loop
-                    logger.info(f"Data fetched for {len(exchange_data)} exchange rates from {provider.provider_name}.")
-                    break
+                async def fetch_window(window_start, window_end, window_dates):
+                    async with semaphore:
+                        url = provider_instance.timeseries_url(base_currency, target_codes, window_start, window_end)
+                        logger.debug(f"Generated URL for {base_currency} to {symbols} from {window_start} to {window_end}: {url}")
+                        exchange_rates = await self.fetch_exchange_rate_window(client, url, base_currency, symbols, window_dates)
+                    for valuation_date, exchange_rate in (exchange_rates or {}).items():
+                        await store(valuation_date, exchange_rate)
+
+                # Cover the missing days with as few range calls as the provider allows, or one call per day without a range endpoint
+                provider_instance = build_provider(provider)
+                if provider_instance and provider_instance.TIMESERIES_MAX_DAYS:
+                    windows = plan_windows(remaining_dates, provider_instance.TIMESERIES_MAX_DAYS)
+                    logger.info(f"Fetching {len(remaining_dates)} days in {len(windows)} range calls.")
+                    fetches = [fetch_window(*window) for window in windows]
+                else:
+                    fetches = [fetch(valuation_date) for valuation_date in remaining_dates]
+
+                # Run the fetches as a bounded, rate-limited pipeline, stopping early if the writer fails
+                fetching = asyncio.gather(*fetches)
+                await asyncio.wait({fetching, writer}, return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    fetching.cancel()
+                    await asyncio.gather(fetching, return_exceptions=True)
+                    writer.result()  # Re-raise the write error; batches written so far are kept
+                await fetching
+                logger.info(f"Data fetched for {len(fetched_dates)} of {len(dates)} days after {provider.provider_name}.")
+
+            await queue.put(None)
+            await writer
 
-            await self.save_data(exchange_data)
-            logger.info('Data saving process completed.')
+            # Days no provider has rates for count as done, failed days keep the checkpoint behind them
+            if self.progress.mark_done(empty_dates - fetched_dates):
+                await self.save_checkpoint()
+            logger.info(f'Data saving process completed, checkpoint at {self.progress.completed_through}.')
+        finally:
+            if not writer.done():
+                writer.cancel()
+            # The pools belong to this command's event loop
+            await provider_http.aclose()
 
     def handle(self, *args, **kwargs):
         logger.info('Starting the command to load exchange rates...')
-        
+
         # Capture start time
         start_time = time.time()
-        
-        asyncio.run(self.load_exchange_rates())
-        
+
+        asyncio.run(self.load_exchange_rates(kwargs))
+
         # Capture end time
         end_time = time.time()
-        
-        # Calculate and log duration
+
+        # Calculate and log duration and throughput
         duration = end_time - start_time
         logger.info(f'Command execution finished in {duration:.2f} seconds.')
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.stats['checkpointed_days']} days skipped by the checkpoint, {self.stats['stored_days']} days already stored, {self.stats['requests']} requests ({self.stats['retries']} retries, {self.stats['failures']} failed), "
+            f"{self.stats['rates']} rates ({self.stats['saved']} saved) in {duration:.2f}s: "
+            f"{self.stats['requests'] / duration:.2f} req/s, {self.stats['rates'] / duration:.2f} rates/s"
+        ))
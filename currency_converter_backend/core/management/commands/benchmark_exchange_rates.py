@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from core.models.currency import Currency
+from core.models.currency_exchange_rate import CurrencyExchangeRate
+from core.services.rate_engine import RateEngine
+from core.services.rate_store import upsert_exchange_rates
+
+# Seeded rows live in a date range no real rate uses, so they can be told apart and removed
+SEED_START = date(1000, 1, 1)
+SEED_END = date(1970, 1, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the convert lookup and the upsert ingest on currency_exchange_rate. Seeds the table with "
+        "synthetic pivot rates first. Run it before and after a schema change (e.g. `migrate core 0009`, "
+        "then `migrate core 0010`) against a disposable database to compare index layouts. The upsert ingest "
+        "needs the unique (source, target, date) key added by 0010."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=3_000_000, help="Synthetic rows to have in the table before benchmarking")
+        parser.add_argument("--lookups", type=int, default=2000, help="Convert lookups to time")
+        parser.add_argument("--targets", type=int, default=5, help="Target currencies per convert lookup")
+        parser.add_argument("--ingest-rows", type=int, default=50_000, help="Rows upserted (and rolled back) by the ingest benchmark")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--cleanup", action="store_true", help="Delete the synthetic rows and exit")
+
+    def handle(self, *args, **options):
+        seeded = CurrencyExchangeRate.objects.filter(valuation_date__range=[SEED_START, SEED_END])
+        if options["cleanup"]:
+            deleted, _ = seeded.delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} synthetic rows."))
+            return
+
+        currency_ids = dict(Currency.objects.values_list("code", "id"))
+        if RateEngine.pivot not in currency_ids or len(currency_ids) < 2:
+            raise CommandError(f"Need the pivot currency {RateEngine.pivot} and at least one other currency to seed rates.")
+        target_codes = sorted(code for code in currency_ids if code != RateEngine.pivot)
+        seed_days = -(-options["rows"] // len(target_codes))
+        if SEED_START + timedelta(days=seed_days) > SEED_END:
+            raise CommandError(f'{options["rows"]} rows do not fit the synthetic date range with {len(target_codes)} currencies.')
+
+        self.seed(seeded.count(), seed_days, currency_ids, target_codes, options["batch_size"])
+        self.stdout.write(f"Database: {connection.vendor} ({connection.settings_dict['ENGINE']}), {CurrencyExchangeRate.objects.count()} rows in {CurrencyExchangeRate._meta.db_table}")
+
+        lookup_timings = self.benchmark_lookups(seed_days, target_codes, options["lookups"], options["targets"])
+        self.stdout.write(f"convert lookup: {len(lookup_timings)} queries, mean {statistics.mean(lookup_timings):.3f} ms, " f"p50 {percentile(lookup_timings, 50):.3f} ms, p95 {percentile(lookup_timings, 95):.3f} ms")
+
+        try:
+            ingest_timings = self.benchmark_ingest(seed_days, currency_ids, target_codes, options["ingest_rows"], options["batch_size"])
+        except DatabaseError as e:
+            self.stdout.write(self.style.WARNING(f"upsert ingest skipped, the table has no unique (source, target, date) key to upsert on: {e}"))
+            return
+        for label, duration in ingest_timings:
+            self.stdout.write(f'upsert ingest ({label}): {options["ingest_rows"]} rows in {duration:.2f}s, {options["ingest_rows"] / duration:.0f} rows/s')
+
+    def seed(self, existing, seed_days, currency_ids, target_codes, batch_size):
+        """Fill whole synthetic days up to ``seed_days``; days already seeded by a previous run are kept."""
+        seeded_days = existing // len(target_codes)
+        if seeded_days >= seed_days:
+            return
+        self.stdout.write(f"Seeding {(seed_days - seeded_days) * len(target_codes)} synthetic rows...")
+        started = time.perf_counter()
+        batch = []
+        for offset in range(seeded_days, seed_days):
+            batch.extend(self.day_rows(SEED_START + timedelta(days=offset), currency_ids, target_codes))
+            if len(batch) >= batch_size:
+                CurrencyExchangeRate.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            CurrencyExchangeRate.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.2f}s.")
+
+    def benchmark_lookups(self, seed_days, target_codes, lookups, targets):
+        """Time ``RateEngine.load_pivot_rates``, the query behind every convert cache miss."""
+        timings = []
+        for _ in range(lookups):
+            valuation_date = SEED_START + timedelta(days=random.randrange(seed_days))
+            codes = random.sample(target_codes, min(targets, len(target_codes)))
+            started = time.perf_counter()
+            RateEngine.load_pivot_rates(codes, valuation_date)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def benchmark_ingest(self, seed_days, currency_ids, target_codes, ingest_rows, batch_size):
+        """
+        Time ``upsert_exchange_rates``, the write path of the backfill and timeseries fills, over new days after
+        the seeded range and then over the same rows again, so every row conflicts and is updated. Both passes
+        are rolled back so runs stay comparable. Returns ``[(label, seconds)]``.
+        """
+        rows = []
+        day = SEED_START + timedelta(days=seed_days)
+        while len(rows) < ingest_rows:
+            rows.extend((RateEngine.pivot, code, day, round(random.uniform(0.1, 150), 6)) for code in target_codes)
+            day += timedelta(days=1)
+        rows = rows[:ingest_rows]
+
+        timings = []
+        with transaction.atomic():
+            for label in ("insert", "update"):
+                started = time.perf_counter()
+                for offset in range(0, len(rows), batch_size):
+                    upsert_exchange_rates(rows[offset : offset + batch_size], currency_ids)
+                timings.append((label, time.perf_counter() - started))
+            transaction.set_rollback(True)
+        return timings
+
+    @staticmethod
+    def day_rows(valuation_date, currency_ids, target_codes):
+        pivot_id = currency_ids[RateEngine.pivot]
+        return [CurrencyExchangeRate(source_currency_id=pivot_id, exchanged_currency_id=currency_ids[code], valuation_date=valuation_date, rate_value=round(random.uniform(0.1, 150), 6)) for code in target_codes]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -1,12 +1,14 @@
 import asyncio
 import logging
 
-import aiohttp
+import httpx
 from channels.db import database_sync_to_async
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from core.models import Currency
+from core.services.currency_list_cache import currency_list_cache
+from core.services.provider_http import provider_http
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -19,29 +21,33 @@ class Command(BaseCommand):
         url = f"https://api.currencybeacon.com/v1/currencies?api_key={settings.CURRENCY_BEACON_API_KEY}&type=fiat"
         try:
             logger.info("Sending request to the API to fetch currencies...")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    response.raise_for_status()  # Check for HTTP errors
-                    json_response = await response.json()
-                    logger.info("API response received successfully.")
-
-                    currency_data = json_response.get("response", [])
-                    if not isinstance(currency_data, list):
-                        logger.error("Unexpected data format from API")
-                        return
-
-                    currencies = []
-                    for currency in currency_data:
-                        currencies.append(Currency(code=currency.get("short_code", ""), name=currency.get("name", ""), symbol=currency.get("symbol", "")))
-
-                    # Bulk create Currency objects in the database
-                    await database_sync_to_async(Currency.objects.bulk_create)(currencies, ignore_conflicts=True)
-                    logger.info("Currencies loaded successfully into the database.")
-
-        except aiohttp.ClientError as e:
+            client = provider_http.get_async_client("CurrencyBeacon")
+            response = await client.get(url)
+            response.raise_for_status()  # Check for HTTP errors
+            json_response = response.json()
+            logger.info("API response received successfully.")
+
+            currency_data = json_response.get("response", [])
+            if not isinstance(currency_data, list):
+                logger.error("Unexpected data format from API")
+                return
+
+            currencies = []
+            for currency in currency_data:
+                currencies.append(Currency(code=currency.get("short_code", ""), name=currency.get("name", ""), symbol=currency.get("symbol", "")))
+
+            # Bulk create Currency objects in the database
+            await database_sync_to_async(Currency.objects.bulk_create)(currencies, ignore_conflicts=True)
+            # bulk_create skips the Currency signals, so drop the cached list here
+            await database_sync_to_async(currency_list_cache.invalidate)()
+            logger.info("Currencies loaded successfully into the database.")
+
+        except httpx.HTTPError as e:
             logger.error(f"Error fetching data from API: {e}")
         except Exception as e:
             logger.error(f"An error occurred: {e}")
+        finally:
+            await provider_http.aclose()
 
     def handle(self, *args, **kwargs):
         logger.info("Starting the command to load currencies...")
@@ -0,0 +1,40 @@
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Optional dependency, clients are served gzip without it
+    brotli = None
+
+re_accepts_brotli = re.compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    ``GZipMiddleware`` that answers with Brotli when the client accepts it and the brotli package is
+    installed. Streaming responses and every other client keep Django's gzip handling.
+    """
+
+    def process_response(self, request, response):
+        if brotli is None or response.streaming or not re_accepts_brotli.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            return super().process_response(request, response)
+
+        # Same guards as GZipMiddleware: skip tiny bodies and anything already encoded
+        if len(response.content) < 200 or response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed_content = brotli.compress(response.content, mode=brotli.MODE_TEXT)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+
+        # The encoded body is a different representation, so a strong ETag becomes weak (RFC 9110 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
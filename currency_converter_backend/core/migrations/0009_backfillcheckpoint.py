@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_alter_currency_load_historical_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('start_date', models.DateField()),
+                ('completed_through', models.DateField()),
+            ],
+            options={
+                'db_table': 'backfill_checkpoint',
+                'managed': True,
+            },
+        ),
+    ]
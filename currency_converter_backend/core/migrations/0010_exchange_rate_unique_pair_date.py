@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:11
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicate_rates(apps, schema_editor):
+    """Keep the most recently inserted row of every (source, target, date) so the unique key can be added."""
+    CurrencyExchangeRate = apps.get_model('core', 'CurrencyExchangeRate')
+    duplicates = (
+        CurrencyExchangeRate.objects.values('source_currency_id', 'exchanged_currency_id', 'valuation_date')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in list(duplicates):
+        CurrencyExchangeRate.objects.filter(
+            source_currency_id=duplicate['source_currency_id'],
+            exchanged_currency_id=duplicate['exchanged_currency_id'],
+            valuation_date=duplicate['valuation_date'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_rates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='rate_value',
+            field=models.DecimalField(decimal_places=6, max_digits=18),
+        ),
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='valuation_date',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='currencyexchangerate',
+            constraint=models.UniqueConstraint(fields=('source_currency', 'exchanged_currency', 'valuation_date'), name='uniq_exchange_rate_pair_date'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_exchange_rate_unique_pair_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyExchangeRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('resolution', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('open_value', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('high_value', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('low_value', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('close_value', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('mean_value', models.DecimalField(decimal_places=6, max_digits=18)),
+                ('days', models.PositiveSmallIntegerField()),
+                ('exchanged_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='target_rollups', to='core.currency')),
+                ('source_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='source_rollups', to='core.currency')),
+            ],
+            options={
+                'db_table': 'currency_exchange_rate_rollup',
+                'managed': True,
+                'constraints': [models.UniqueConstraint(fields=('source_currency', 'exchanged_currency', 'resolution', 'period_start'), name='uniq_exchange_rate_rollup_period')],
+            },
+        ),
+    ]
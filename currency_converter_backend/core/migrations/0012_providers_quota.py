@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_currencyexchangeraterollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providers',
+            name='daily_quota',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='providers',
+            name='requests_per_second',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from core.models.base_model import BaseModel
 from core.models.currency_exchange_rate import CurrencyExchangeRate
+from core.models.currency_exchange_rate_rollup import CurrencyExchangeRateRollup
 from core.models.currency import Currency
 from core.models.providers import Providers
+from core.models.backfill_checkpoint import BackfillCheckpoint
@@ -0,0 +1,18 @@
+from django.db import models
+
+from core.models.base_model import BaseModel
+
+
+class BackfillCheckpoint(BaseModel):
+    # Identifies a backfill by provider, pivot and currency set
+    key = models.CharField(max_length=255, unique=True)
+    start_date = models.DateField()
+    # Every date from start_date through completed_through has been fetched and stored
+    completed_through = models.DateField()
+
+    class Meta:
+        managed = True
+        db_table = "backfill_checkpoint"
+
+    def __str__(self):
+        return f"{self.key}: {self.start_date} - {self.completed_through}"
@@ -5,9 +5,13 @@ from core.models.base_model import BaseModel
 class CurrencyExchangeRate(BaseModel):  # Import Model as models.Model
     source_currency = models.ForeignKey(Currency, related_name='source_exchanges', on_delete=models.CASCADE)
     exchanged_currency = models.ForeignKey(Currency, related_name='target_exchanges', on_delete=models.CASCADE)
-    valuation_date = models.DateField(db_index=True)
-    rate_value = models.DecimalField(decimal_places=6, max_digits=18, db_index=True)
+    valuation_date = models.DateField()
+    rate_value = models.DecimalField(decimal_places=6, max_digits=18)
 
     class Meta:
         managed = True
-        db_table = 'currency_exchange_rate'
\ No newline at end of file
+        db_table = 'currency_exchange_rate'
+        constraints = [
+            # One rate per pair and day, in the (source, target, date) order lookups filter on
+            models.UniqueConstraint(fields=['source_currency', 'exchanged_currency', 'valuation_date'], name='uniq_exchange_rate_pair_date'),
+        ]
@@ -0,0 +1,33 @@
+from django.db import models
+
+from core.models.base_model import BaseModel
+from core.models.currency import Currency
+
+
+class CurrencyExchangeRateRollup(BaseModel):
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    RESOLUTION_CHOICES = [
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+    ]
+
+    # Aggregates of the stored daily pivot -> currency rates over one week (from Monday) or calendar month
+    source_currency = models.ForeignKey(Currency, related_name="source_rollups", on_delete=models.CASCADE)
+    exchanged_currency = models.ForeignKey(Currency, related_name="target_rollups", on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    period_start = models.DateField()
+    open_value = models.DecimalField(decimal_places=6, max_digits=18)
+    high_value = models.DecimalField(decimal_places=6, max_digits=18)
+    low_value = models.DecimalField(decimal_places=6, max_digits=18)
+    close_value = models.DecimalField(decimal_places=6, max_digits=18)
+    mean_value = models.DecimalField(decimal_places=6, max_digits=18)
+    # Daily rates the period was built from, used to tell complete periods from ones with gaps
+    days = models.PositiveSmallIntegerField()
+
+    class Meta:
+        managed = True
+        db_table = "currency_exchange_rate_rollup"
+        constraints = [
+            models.UniqueConstraint(fields=["source_currency", "exchanged_currency", "resolution", "period_start"], name="uniq_exchange_rate_rollup_period"),
+        ]
@@ -7,6 +7,9 @@ class Providers(BaseModel):
     is_active = models.BooleanField(default=True)
     credentials = models.JSONField(null=True, blank=True)
     priority = models.IntegerField(default=1)    
+    # Upstream allowance shared by conversions, timeseries and backfills across every process; empty means unlimited
+    requests_per_second = models.FloatField(null=True, blank=True)
+    daily_quota = models.IntegerField(null=True, blank=True)
     
     class Meta:
         managed = True
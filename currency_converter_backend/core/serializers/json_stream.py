@@ -0,0 +1,48 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def wants_stream(request):
+    return request.GET.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+class ChunkBuffer:
+    """Collects JSON fragments and hands them out in chunks of ``FLUSH_ITEMS`` items, so a stream isn't one write per row."""
+
+    def __init__(self, flush_items=None):
+        self.flush_items = flush_items or settings.STREAMING["FLUSH_ITEMS"]
+        self.parts = []
+        self.items = 0
+
+    def add(self, part, item=False):
+        self.parts.append(part)
+        if item:
+            self.items += 1
+
+    def full(self):
+        return self.items >= self.flush_items
+
+    def flush(self):
+        chunk = "".join(self.parts)
+        self.parts, self.items = [], 0
+        return chunk
+
+
+async def stream_json_array(items, flush_items=None):
+    """Write the JSON-serialisable values of an async iterable as one JSON array, chunk by chunk."""
+    buffer = ChunkBuffer(flush_items)
+    buffer.add("[")
+    separator = ""
+    async for item in items:
+        buffer.add(separator + dumps(item), item=True)
+        separator = ","
+        if buffer.full():
+            yield buffer.flush()
+    buffer.add("]")
+    yield buffer.flush()
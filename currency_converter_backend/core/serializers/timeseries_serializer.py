@@ -0,0 +1,93 @@
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from core.serializers.json_stream import ChunkBuffer, dumps
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency, the binary format is only offered when it is installed
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+COLUMNAR_CONTENT_TYPE = "application/vnd.mycurrency.columnar+json"
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def rows_payload(frame):
+    """Default shape: ``{code: {"rates": [{"valuation_date", "rate_value"}]}}``, skipping days without a rate."""
+    payload = {}
+    for code, values in frame["values"].items():
+        if code in frame["errors"]:
+            payload[code] = frame["errors"][code]
+            continue
+        payload[code] = {"rates": [{"valuation_date": valuation_date.isoformat(), "rate_value": str(rate_value)} for valuation_date, rate_value in zip(frame["dates"], values) if rate_value is not None]}
+    return payload
+
+
+async def stream_rows_payload(to_currencies, errors, points, flush_items=None):
+    """
+    Streaming form of ``rows_payload``. ``points`` is an async iterable of ``(code, valuation_date, rate)``
+    grouped by currency and ordered by date within each; currencies without points or with an error
+    are written after them.
+    """
+    buffer = ChunkBuffer(flush_items)
+    buffer.add("{")
+    written, current, separator = [], None, ""
+    async for code, valuation_date, rate_value in points:
+        if code != current:
+            if current is not None:
+                buffer.add("]}")
+            buffer.add(("," if written else "") + f'{dumps(code)}: {{"rates": [')
+            written.append(code)
+            current, separator = code, ""
+        buffer.add(separator + dumps({"valuation_date": valuation_date.isoformat(), "rate_value": str(rate_value)}), item=True)
+        separator = ", "
+        if buffer.full():
+            yield buffer.flush()
+    if current is not None:
+        buffer.add("]}")
+    for code in to_currencies:
+        if code not in written:
+            buffer.add(("," if written else "") + f"{dumps(code)}: {dumps(errors.get(code, {'rates': []}))}")
+            written.append(code)
+    buffer.add("}")
+    yield buffer.flush()
+
+
+def columnar_payload(frame):
+    """
+    ``{"base", "resolution", "dates": [...], "values": {code: [...]}, "errors": {code: ...}}`` with the dates
+    listed once and every currency's values aligned to them. Days a currency has no rate for are ``null``.
+    """
+    return {
+        "base": frame["base"],
+        "resolution": frame["resolution"],
+        "dates": [valuation_date.isoformat() for valuation_date in frame["dates"]],
+        "values": {code: [None if rate_value is None else float(rate_value) for rate_value in values] for code, values in frame["values"].items() if code not in frame["errors"]},
+        "errors": frame["errors"],
+    }
+
+
+def negotiate_format(request):
+    """Pick the first media type of the Accept header we can produce; anything else gets the default JSON rows."""
+    for media_type in request.accepted_types:
+        full_type = f"{media_type.main_type}/{media_type.sub_type}"
+        if full_type == COLUMNAR_CONTENT_TYPE:
+            return COLUMNAR_CONTENT_TYPE
+        if full_type in MSGPACK_CONTENT_TYPES and msgpack is not None:
+            return full_type
+        if full_type == JSON_CONTENT_TYPE or media_type.is_all_types:
+            break
+    return JSON_CONTENT_TYPE
+
+
+def timeseries_response(request, frame):
+    content_type = negotiate_format(request)
+    if content_type == COLUMNAR_CONTENT_TYPE:
+        response = JsonResponse(columnar_payload(frame), content_type=COLUMNAR_CONTENT_TYPE)
+    elif content_type in MSGPACK_CONTENT_TYPES:
+        response = HttpResponse(msgpack.packb(columnar_payload(frame)), content_type=content_type)
+    else:
+        response = JsonResponse(rows_payload(frame))
+    patch_vary_headers(response, ["Accept"])
+    return response
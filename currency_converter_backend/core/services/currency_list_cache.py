@@ -0,0 +1,63 @@
+import hashlib
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from core.models import Currency
+from core.serializers.currency_serializer import CurrencySerializer
+from core.services.shared_cache import is_process_local
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class CurrencyListCache:
+    """
+    The serialized currency list, built once and kept in the Django cache with its validators.
+
+    Entries are ``{"body": bytes, "etag": str, "last_modified": int}`` (a Unix timestamp). The list only changes through
+    the admin or ``bulk_load_currencies``, so entries in a shared cache never expire and are dropped by ``invalidate``.
+    A per-process cache only sees the invalidations of its own process, so there entries expire after ``LOCAL_TIMEOUT``.
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.CURRENCY_LIST_CACHE
+        self.alias = config.get("ALIAS", "default")
+        self.key = config.get("KEY", "currency_list")
+        self.local_timeout = config.get("LOCAL_TIMEOUT", 60)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def build():
+        data = CurrencySerializer(Currency.objects.order_by("id"), many=True).data
+        body = json.dumps(data).encode("utf-8")
+        return {
+            "body": body,
+            # Strong validator: any change to the serialized bytes changes the tag
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"',
+            # Build time rather than the newest updated_at, so deletions move it forward too
+            "last_modified": int(timezone.now().timestamp()),
+        }
+
+    async def aget(self):
+        entry = await self.cache.aget(self.key)
+        if entry is None:
+            entry = await sync_to_async(self.build)()
+            await self.cache.aset(self.key, entry, timeout=self.local_timeout if is_process_local(self.alias) else None)
+        return entry
+
+    def invalidate(self):
+        try:
+            self.cache.delete(self.key)
+        except Exception as e:
+            logger.error(f"Error invalidating the currency list cache: {e}")
+
+
+currency_list_cache = CurrencyListCache()
@@ -1,63 +1,352 @@
 # services.py
 
-import requests
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db.models import Count
+
+from core.models import Currency, CurrencyExchangeRateRollup, Providers
+from core.serializers.timeseries_serializer import rows_payload
+from core.services.exchange_rate_service import provider_registry
+from core.services.provider_http import provider_http
+from core.services.provider_quota import INTERACTIVE, QuotaExceededError, provider_quota
+from core.services.rate_cache import rate_cache
+from core.services.rate_engine import RateEngine
+from core.services.rate_store import contiguous_ranges, load_currency_ids, period_end, period_start, period_starts, rebuild_rollups, upsert_exchange_rates
 
-from core.models import Currency, CurrencyExchangeRate
+# Set up logging
+logger = logging.getLogger(__name__)
 
 
 class CurrencyTimeseriesService:
-    API_URL = f"https://api.currencybeacon.com/v1/timeseries?api_key={settings.CURRENCY_BEACON_API_KEY}"
+    # Provider whose range endpoint fills missing days; its url, credentials and call limit come from the registry
+    PROVIDER_NAME = settings.CURRENT_PROVIDER
+    DAILY = "daily"
+    RESOLUTIONS = (DAILY, CurrencyExchangeRateRollup.WEEKLY, CurrencyExchangeRateRollup.MONTHLY)
 
     @staticmethod
-    def fetch_currency_timeseries(base_currency_code, to_currencies, start_date, end_date):
-        results = {}
-        for to_currency_code in to_currencies:
-            base_currency = Currency.objects.filter(code=base_currency_code).first()
-            to_currency = Currency.objects.filter(code=to_currency_code).first()
+    async def fetch_currency_timeseries(base_currency_code, to_currencies, start_date, end_date):
+        """``{code: {"rates": [{"valuation_date", "rate_value"}]}}`` for every target, see ``load_currency_timeseries``."""
+        frame = await CurrencyTimeseriesService.load_currency_timeseries(base_currency_code, to_currencies, start_date, end_date)
+        if isinstance(frame, tuple):
+            return frame
+        return rows_payload(frame)
 
-            if not base_currency:
-                return {"error": f"Base currency '{base_currency_code}' not found"}, 400
-            if not to_currency:
+    @staticmethod
+    async def validate_currencies(base_currency_code, to_currencies):
+        """``(error, 400)`` when the base or a target currency is unknown, checked with one query."""
+        known_codes = {code async for code in Currency.objects.filter(code__in=[base_currency_code, *to_currencies]).values_list("code", flat=True)}
+        if base_currency_code not in known_codes:
+            return {"error": f"Base currency '{base_currency_code}' not found"}, 400
+        for to_currency_code in to_currencies:
+            if to_currency_code not in known_codes:
                 return {"error": f"Target currency '{to_currency_code}' not found"}, 400
+        return None
+
+    @staticmethod
+    async def stream_currency_timeseries(base_currency_code, to_currencies, start_date, end_date, chunk_size=None):
+        """
+        Streaming form of the daily ``load_currency_timeseries``. Incomplete days are found with one per-date
+        count query, the codes missing on them with a second one, and filled before anything is written. Returns ``{"to_currencies", "errors", "points"}``,
+        where ``points`` asynchronously yields ``(code, valuation_date, rate)`` per currency in date order,
+        or ``(error, status)`` for unknown currencies.
+
+        Points are read in keyset pages of ``chunk_size`` rows over the (source, target, date) key, so neither
+        the worker nor the database driver holds the whole series. Only the base leg (one rate per day) is
+        kept in memory when the base isn't the pivot.
+        """
+        to_currencies = list(dict.fromkeys(to_currencies))
+        error = await CurrencyTimeseriesService.validate_currencies(base_currency_code, to_currencies)
+        if error:
+            return error
+        chunk_size = chunk_size or settings.STREAMING["CHUNK_SIZE"]
+
+        end_date = min(end_date, date.today())
+        all_dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        codes = RateEngine.pivot_codes(base_currency_code, *to_currencies)
+        failed_codes = {}
+        if codes:
+            complete_dates = {
+                valuation_date
+                async for valuation_date in RateEngine.pivot_rates_queryset(codes, valuation_date__range=[start_date, end_date])
+                .values("valuation_date")
+                .annotate(stored=Count("exchanged_currency", distinct=True))
+                .filter(stored__gte=len(codes))
+                .values_list("valuation_date", flat=True)
+            }
+            incomplete_dates = [valuation_date for valuation_date in all_dates if valuation_date not in complete_dates]
+            missing_dates_by_code = {code: () for code in codes}
+            if incomplete_dates:
+                # Only the incomplete days are read per code, so a code missing on a day doesn't refetch the others
+                stored = {row async for row in RateEngine.pivot_rates_queryset(codes, valuation_date__range=[incomplete_dates[0], incomplete_dates[-1]]).values_list("exchanged_currency__code", "valuation_date").distinct()}
+                missing_dates_by_code = {code: tuple(valuation_date for valuation_date in incomplete_dates if (code, valuation_date) not in stored) for code in codes}
+            _, failed_codes = await CurrencyTimeseriesService.fetch_missing(missing_dates_by_code)
+
+        errors = {}
+        for to_currency_code in to_currencies:
+            error = failed_codes.get(to_currency_code) or failed_codes.get(base_currency_code)
+            if error:
+                errors[to_currency_code] = error
+
+        async def points():
+            base_leg = None
+            if base_currency_code != RateEngine.pivot:
+                base_leg = {valuation_date: rate async for valuation_date, rate in CurrencyTimeseriesService.aiter_pivot_leg(base_currency_code, start_date, end_date, chunk_size)}
+
+            for to_currency_code in sorted(code for code in to_currencies if code not in errors):
+                if to_currency_code in (RateEngine.pivot, base_currency_code):
+                    # No stored leg of its own, the base leg's days (or every day, pivot to pivot) carry the rate
+                    leg_dates = sorted(base_leg) if base_leg is not None else all_dates
+                    for valuation_date in leg_dates:
+                        yield to_currency_code, valuation_date, RateEngine.cross_rate({base_currency_code: base_leg[valuation_date]} if base_leg else {}, base_currency_code, to_currency_code)
+                    continue
+                async for valuation_date, rate in CurrencyTimeseriesService.aiter_pivot_leg(to_currency_code, start_date, end_date, chunk_size):
+                    pivot_rates = {to_currency_code: rate}
+                    if base_leg is not None:
+                        if valuation_date not in base_leg:
+                            continue
+                        pivot_rates[base_currency_code] = base_leg[valuation_date]
+                    yield to_currency_code, valuation_date, RateEngine.cross_rate(pivot_rates, base_currency_code, to_currency_code)
+
+        return {"to_currencies": to_currencies, "errors": errors, "points": points()}
+
+    @staticmethod
+    async def aiter_pivot_leg(code, start_date, end_date, chunk_size):
+        """``(valuation_date, rate(pivot -> code))`` in date order, one keyset page of ``chunk_size`` rows per query."""
+        after = start_date - timedelta(days=1)
+        while True:
+            page = [row async for row in RateEngine.pivot_rates_queryset([code], valuation_date__gt=after, valuation_date__lte=end_date).order_by("valuation_date").values_list("valuation_date", "rate_value")[:chunk_size]]
+            for row in page:
+                yield row
+            if len(page) < chunk_size:
+                return
+            after = page[-1][0]
+
+    @staticmethod
+    def choose_resolution(start_date, end_date, resolution=None, max_points=None):
+        """
+        ``daily``, ``weekly`` or ``monthly``. An explicit ``resolution`` wins; otherwise the finest resolution
+        whose point count fits ``max_points`` is used, and daily when neither is given.
+        """
+        if resolution:
+            if resolution not in CurrencyTimeseriesService.RESOLUTIONS:
+                raise ValueError(f"Unknown resolution '{resolution}', expected one of: {', '.join(CurrencyTimeseriesService.RESOLUTIONS)}")
+            return resolution
+        if not max_points:
+            return CurrencyTimeseriesService.DAILY
+        days = (end_date - start_date).days + 1
+        if days <= max_points:
+            return CurrencyTimeseriesService.DAILY
+        if len(period_starts(start_date, end_date, CurrencyExchangeRateRollup.WEEKLY)) <= max_points:
+            return CurrencyExchangeRateRollup.WEEKLY
+        return CurrencyExchangeRateRollup.MONTHLY
+
+    @staticmethod
+    async def load_currency_timeseries(base_currency_code, to_currencies, start_date, end_date, resolution=DAILY):
+        """
+        Build the series of every ``base -> target`` pair. Daily series come from one query over the stored
+        pivot rates, fetching only the date intervals the database is missing; fetched points are persisted
+        so the next request for the range stays in the database. Weekly and monthly series read one close
+        per period from the rollup table instead, so their cost doesn't grow with the number of days.
+
+        Returns a frame ``{"base", "resolution", "dates": [date], "values": {code: [Decimal | None]}, "errors": {code: ...}}``
+        with every currency's values aligned to the shared dates (period starts for rollups), or
+        ``(error, status)`` for unknown currencies.
+        """
+        to_currencies = list(dict.fromkeys(to_currencies))
+        error = await CurrencyTimeseriesService.validate_currencies(base_currency_code, to_currencies)
+        if error:
+            return error
+
+        codes = RateEngine.pivot_codes(base_currency_code, *to_currencies)
+        if resolution == CurrencyTimeseriesService.DAILY:
+            rates_by_date, failed_codes = await CurrencyTimeseriesService.load_pivot_series(codes, start_date, end_date)
+        else:
+            rates_by_date, failed_codes = await CurrencyTimeseriesService.load_pivot_rollups(codes, resolution, start_date, end_date)
+
+        dates = sorted(rates_by_date)
+        frame = {"base": base_currency_code, "resolution": resolution, "dates": dates, "values": {}, "errors": {}}
+        for to_currency_code in to_currencies:
+            error = failed_codes.get(to_currency_code) or failed_codes.get(base_currency_code)
+            if error:
+                frame["errors"][to_currency_code] = error
+            frame["values"][to_currency_code] = [RateEngine.cross_rate(rates_by_date[valuation_date], base_currency_code, to_currency_code) for valuation_date in dates]
+        return frame
+
+    @staticmethod
+    async def load_pivot_series(codes, start_date, end_date):
+        """
+        ``({valuation_date: {code: rate(pivot -> code)}}, {code: error})`` for every day of the range up to today,
+        fetching and persisting the days the database is missing.
+        """
+        # No provider has rates for days that haven't happened yet
+        end_date = min(end_date, date.today())
+        all_dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        if not codes:
+            # Pivot to pivot only, no stored rows needed
+            return defaultdict(dict, ((valuation_date, {}) for valuation_date in all_dates)), {}
+
+        pivot_rates_by_date = await RateEngine.aload_pivot_series(codes, start_date, end_date)
+        missing_dates_by_code = {code: tuple(valuation_date for valuation_date in all_dates if code not in pivot_rates_by_date.get(valuation_date, {})) for code in codes}
+        fetched_rates_by_date, failed_codes = await CurrencyTimeseriesService.fetch_missing(missing_dates_by_code)
+        for valuation_date, rates in fetched_rates_by_date.items():
+            pivot_rates_by_date[valuation_date].update(rates)
+        return pivot_rates_by_date, failed_codes
+
+    @staticmethod
+    async def fetch_missing(missing_dates_by_code):
+        """
+        Fetch and persist ``{code: missing dates}``; returns ``({valuation_date: {code: rate}}, {code: error})``.
+        Days the provider answered without a rate are remembered in the rate cache and not asked for again
+        until the marker expires, so ranges the provider doesn't (yet) cover stop going upstream on every request.
+        """
+        fetched_rates_by_date, failed_codes = defaultdict(dict), {}
+        empty_dates = await rate_cache.aget_empty_dates(RateEngine.pivot, missing_dates_by_code)
+        missing_dates_by_code = {code: tuple(valuation_date for valuation_date in missing_dates if valuation_date not in empty_dates.get(code, ())) for code, missing_dates in missing_dates_by_code.items()}
+        if not any(missing_dates_by_code.values()):
+            return fetched_rates_by_date, failed_codes
+
+        provider_instance = await CurrencyTimeseriesService.get_timeseries_provider()
+        if provider_instance is None:
+            failed_codes.update(dict.fromkeys((code for code, dates in missing_dates_by_code.items() if dates), {"error": "No timeseries provider available"}))
+            return fetched_rates_by_date, failed_codes
+        fetch_plan = CurrencyTimeseriesService.plan_fetches(missing_dates_by_code, provider_instance.TIMESERIES_MAX_DAYS)
+
+        logger.info(f"{len(fetch_plan)} timeseries calls needed for missing days of: {', '.join(code for code, dates in missing_dates_by_code.items() if dates)}")
+        fetched = await CurrencyTimeseriesService.fetch_plan_from_api(provider_instance, RateEngine.pivot, fetch_plan)
+        answered_empty = defaultdict(list)
+        for (symbols, interval_start, interval_end), outcome in zip(fetch_plan, fetched):
+            if "error" in outcome:
+                failed_codes.update(dict.fromkeys(symbols, outcome))
+                continue
+            for valuation_date, rates in outcome["rates"].items():
+                fetched_rates_by_date[valuation_date].update(rates)
+            for code in symbols:
+                answered_empty[code].extend(valuation_date for valuation_date in missing_dates_by_code[code] if interval_start <= valuation_date <= interval_end and code not in outcome["rates"].get(valuation_date, {}))
+
+        await sync_to_async(CurrencyTimeseriesService.store_pivot_rates)(fetched_rates_by_date)
+        await rate_cache.aset_empty_dates(RateEngine.pivot, answered_empty)
+        return fetched_rates_by_date, failed_codes
 
-            # Query the database for the exchange rates
-            exchange_rates = CurrencyExchangeRate.objects.filter(source_currency=base_currency, exchanged_currency=to_currency, valuation_date__range=[start_date, end_date]).order_by("valuation_date")
+    @staticmethod
+    async def load_pivot_rollups(codes, resolution, start_date, end_date):
+        """
+        ``({period_start: {code: close(pivot -> code)}}, {code: error})`` for every period overlapping the range.
+        Periods not built from every one of their days (not yet rolled up, or with gaps) are filled through
+        the daily path once and rebuilt, so the steady state is a single rollup query.
+        """
+        start_date = period_start(start_date, resolution)
+        # Whole periods, but never past today so the current one can be complete
+        end_date = min(period_end(period_start(end_date, resolution), resolution), date.today())
+        if not codes:
+            return defaultdict(dict, ((start, {}) for start in period_starts(start_date, end_date, resolution))), {}
+
+        expected_days = {start: (min(period_end(start, resolution), end_date) - start).days + 1 for start in period_starts(start_date, end_date, resolution)}
+        closes_by_period, days = await RateEngine.aload_pivot_rollups(codes, resolution, start_date, end_date)
+        incomplete = [start for start, expected in expected_days.items() if any(days.get((code, start), 0) < expected for code in codes)]
+        if incomplete:
+            # Days the provider has no rate for can never be rolled up; they don't make a period incomplete
+            empty_dates = await rate_cache.aget_empty_dates(RateEngine.pivot, {code: [start + timedelta(days=offset) for start in incomplete for offset in range(expected_days[start])] for code in codes})
+            incomplete = [start for start in incomplete if any(days.get((code, start), 0) + sum(1 for valuation_date in empty_dates.get(code, ()) if period_start(valuation_date, resolution) == start) < expected_days[start] for code in codes)]
+        if not incomplete:
+            return closes_by_period, {}
+
+        fill_start, fill_end = min(incomplete), min(period_end(max(incomplete), resolution), end_date)
+        _, failed_codes = await CurrencyTimeseriesService.load_pivot_series(codes, fill_start, fill_end)
+        await sync_to_async(rebuild_rollups)(codes, fill_start, fill_end, [resolution])
+        closes_by_period, _ = await RateEngine.aload_pivot_rollups(codes, resolution, start_date, end_date)
+        return closes_by_period, failed_codes
 
-            if exchange_rates.exists():
-                first_rate = exchange_rates.first()
-                last_rate = exchange_rates.last()
+    @staticmethod
+    def store_pivot_rates(pivot_rates_by_date):
+        rows = [(RateEngine.pivot, code, valuation_date, rate) for valuation_date, rates in pivot_rates_by_date.items() for code, rate in rates.items()]
+        if rows:
+            upsert_exchange_rates(rows, load_currency_ids())
+
+    @staticmethod
+    async def get_timeseries_provider():
+        """The active ``PROVIDER_NAME`` instance when it has a range endpoint, else ``None``."""
+        try:
+            provider_instance = await provider_registry.aget(CurrencyTimeseriesService.PROVIDER_NAME)
+        except Providers.DoesNotExist as e:
+            logger.error(f"Cannot fetch timeseries: {e}")
+            return None
+        if not provider_instance.TIMESERIES_MAX_DAYS:
+            logger.error(f"Cannot fetch timeseries: {CurrencyTimeseriesService.PROVIDER_NAME} has no range endpoint")
+            return None
+        return provider_instance
+
+    @staticmethod
+    def plan_fetches(missing_dates_by_code, max_days):
+        """
+        Turn ``{code: missing dates}`` into ``[(symbols, start_date, end_date)]`` upstream calls. Codes missing
+        the same days share one multi-symbol call per contiguous window of at most ``max_days`` days.
+        """
+        codes_by_dates = defaultdict(list)
+        for code, missing_dates in missing_dates_by_code.items():
+            if missing_dates:
+                codes_by_dates[missing_dates].append(code)
+
+        symbols_per_call = settings.CONVERSION_FETCH["SYMBOLS_PER_CALL"]
+        fetch_plan = []
+        for missing_dates, codes in codes_by_dates.items():
+            for interval_start, interval_end in contiguous_ranges(missing_dates, max_days):
+                for offset in range(0, len(codes), symbols_per_call):
+                    fetch_plan.append((codes[offset : offset + symbols_per_call], interval_start, interval_end))
+        return fetch_plan
+
+    @staticmethod
+    async def fetch_plan_from_api(provider_instance, base_currency_code, fetch_plan):
+        """Run the planned calls concurrently over the provider's keep-alive pool; outcomes come back in plan order."""
+        semaphore = asyncio.Semaphore(settings.CONVERSION_FETCH["MAX_CONCURRENCY"])
+        client = provider_http.get_async_client(provider_instance.provider_name)
+        limits = await provider_registry.alimits(provider_instance.provider_name)
 
-                # Check if the database records match the requested range
-                if first_rate.valuation_date > start_date or last_rate.valuation_date < end_date:
-                    print(f"Data not matching with the requested range. Fetching from API for: {to_currency_code}")
-                    results[to_currency_code] = CurrencyTimeseriesService.fetch_from_api(base_currency_code, to_currency_code, start_date, end_date)
-                else:
-                    results[to_currency_code] = {"rates": [{"valuation_date": rate.valuation_date.isoformat(), "rate_value": str(rate.rate_value)} for rate in exchange_rates]}
-            else:
-                print(f"No data found in DB, fetching from API for: {to_currency_code}")
-                results[to_currency_code] = CurrencyTimeseriesService.fetch_from_api(base_currency_code, to_currency_code, start_date, end_date)
+        async def fetch(symbols, start_date, end_date):
+            async with semaphore:
+                # The same API key serves conversions and the backfill, so take a slot of its shared quota first
+                try:
+                    await provider_quota.acquire(provider_instance.provider_name, priority=INTERACTIVE, **limits)
+                except QuotaExceededError as e:
+                    logger.warning(f"Not fetching timeseries for {','.join(symbols)} from {start_date} to {end_date}: {e}")
+                    return {"error": f"{provider_instance.provider_name} API quota used up, try again later"}
+                return await CurrencyTimeseriesService.fetch_from_api(client, provider_instance, base_currency_code, symbols, start_date, end_date)
 
-        return results
+        return await asyncio.gather(*(fetch(*call) for call in fetch_plan))
 
     @staticmethod
-    def fetch_from_api(base_currency_code, to_currency_code, start_date, end_date):
-        url = f"{CurrencyTimeseriesService.API_URL}&base={base_currency_code}&start_date={start_date}&end_date={end_date}&symbols={to_currency_code}"
-        response = requests.get(url)
+    async def fetch_from_api(client, provider_instance, base_currency_code, symbols, start_date, end_date):
+        url = provider_instance.timeseries_url(base_currency_code, symbols, start_date, end_date)
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching timeseries for {','.join(symbols)} from {start_date} to {end_date}: {e}")
+            return {"error": f"Failed to fetch data from {provider_instance.provider_name} API"}
         if response.status_code == 200:
-            return parse_api_response(response.json(), base_currency_code, to_currency_code)
+            return parse_api_response(response.json(), base_currency_code, symbols)
         else:
-            return {"error": "Failed to fetch data from Currency Beacon API", "status": response.status_code}
+            return {"error": f"Failed to fetch data from {provider_instance.provider_name} API", "status": response.status_code}
 
 
-def parse_api_response(api_data, base_currency_code, target_currency_code):
-    """Parse the API response to a uniform format."""
-    parsed_results = {"rates": []}
+def parse_api_response(api_data, base_currency_code, target_currency_codes):
+    """
+    Split a multi-symbol timeseries response back out per target, as ``{"rates": {valuation_date: {code: Decimal}}}``.
+    Targets the response has no value for on a day are left out of that day.
+    """
+    parsed_results = {"rates": {}}
     if "response" in api_data:
         rates_data = api_data["response"]
-        for date, rates in rates_data.items():
-            if target_currency_code in rates:
-                parsed_results["rates"].append({"valuation_date": date, "rate_value": str(rates[target_currency_code])})  # Ensure the rate is a string
+        for date_str, rates in rates_data.items():
+            valuation_date = date.fromisoformat(date_str)
+            for target_currency_code in target_currency_codes:
+                if rates.get(target_currency_code) is not None:
+                    parsed_results["rates"].setdefault(valuation_date, {})[target_currency_code] = Decimal(str(rates[target_currency_code]))  # Keep the digits the API sent
     else:
         return {"error": "Unexpected API response format"}
 
@@ -1,73 +1,525 @@
+import asyncio
 from abc import ABC, abstractmethod
-from datetime import datetime
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
 import random
+import threading
+import time
 import httpx
 from django.conf import settings
+from django.utils.module_loading import import_string
 from core.models.providers import Providers  # Adjust import based on your app structure
+from core.services.provider_http import provider_http
+from core.services.provider_quota import INTERACTIVE, provider_quota
 import logging
 from asgiref.sync import sync_to_async
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+CONVERTED_AMOUNT_PLACES = Decimal("0.001")
+
+
 class CurrencyProvider(ABC):
+    TIMESERIES_MAX_DAYS = None
+    # Providers answering with made-up rates set this to False and are never registered for traffic
+    SERVES_REAL_RATES = True
+
     @abstractmethod
-    async def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: datetime, amount: str):
-        """Retrieve the exchange rate."""
+    async def get_exchange_rates(self, source_currency: str, exchanged_currencies: list, valuation_date: datetime):
+        """Retrieve the full-precision rate vector ``{code: Decimal}`` of a source currency on a date."""
         pass
 
 class CurrencyBeacon(CurrencyProvider):
+    # Longest window the timeseries endpoint serves in one call; providers without a range endpoint leave this unset
+    TIMESERIES_MAX_DAYS = 365
+
     def __init__(self, provider_data):
+        self.provider_name = provider_data.provider_name
         self.api_key = provider_data.credentials['api-key']  # Ensure this is correct
         self.base_url = provider_data.provider_url  # Ensure this is correct
 
-    async def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: datetime, amount: str):
-        logger.debug("Fetching exchange rate from CurrencyBeacon...")
+    def rates_url(self, source_currency: str, exchanged_currencies: list, valuation_date: datetime):
+        symbols = ','.join(exchanged_currencies)
+        if valuation_date.date() >= date.today():
+            return f"{self.base_url}latest?api_key={self.api_key}&base={source_currency}&symbols={symbols}"
+        return f"{self.base_url}historical?api_key={self.api_key}&base={source_currency}&date={valuation_date.strftime('%Y-%m-%d')}&symbols={symbols}"
+
+    def timeseries_url(self, source_currency: str, exchanged_currencies: list, start_date: date, end_date: date):
+        return f"{self.base_url}timeseries?api_key={self.api_key}&base={source_currency}&start_date={start_date.isoformat()}&end_date={end_date.isoformat()}&symbols={','.join(exchanged_currencies)}"
+
+    async def get_exchange_rates(self, source_currency: str, exchanged_currencies: list, valuation_date: datetime):
+        logger.debug("Fetching exchange rates from CurrencyBeacon...")
         try:
-            url = f"{self.base_url}convert?api_key={self.api_key}&from={source_currency}&to={exchanged_currency}&amount={amount}"
+            url = self.rates_url(source_currency, exchanged_currencies, valuation_date)
             logger.debug(f"URL: {url}")
 
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                json_response = response.json()
-                logger.debug(f"Response: {json_response}")
+            # Reuse the provider's keep-alive pool instead of a new connection per conversion
+            client = provider_http.get_async_client(self.provider_name)
+            response = await client.get(url)
+            response.raise_for_status()
+            json_response = response.json()
+            logger.debug(f"Response: {json_response}")
 
-                if json_response.get('value'):
-                    print("CurrencyBeacon API response", json_response)
-                    return round(json_response.get('value'), 2)
-                return 'N/A'
+            rates = json_response.get('response', {}).get('rates', {})
+            # Go through str so the provider's float keeps the digits it was sent with
+            return {code: Decimal(str(rates[code])) for code in exchanged_currencies if rates.get(code) is not None}
         except Exception as e:
+            # Let the provider chain fail over rather than answering with made-up rates
             logger.error(f"Error loading currency data from CurrencyBeacon: {e}")
-            return await MockCurrencyProvider().get_exchange_rate(source_currency, exchanged_currency, valuation_date, amount)
+            raise
 
 class MockCurrencyProvider(CurrencyProvider):
-    def __init__(self, provider_data):
+    # Random rates: stored as pivot rows they would corrupt every cross rate derived from them
+    SERVES_REAL_RATES = False
+
+    def __init__(self, provider_data=None):
         # Optional: can use provider_data if needed
         pass
-    
-    async def get_exchange_rate(self, source_currency: str, exchanged_currency: str, valuation_date: datetime, amount: str):
-        mock_rate = round(random.uniform(0.5, 1.5), 2)
-        logger.debug(f"Mock rate generated: {mock_rate} for {source_currency} to {exchanged_currency}")
-        return mock_rate
 
+    async def get_exchange_rates(self, source_currency: str, exchanged_currencies: list, valuation_date: datetime):
+        mock_rates = {code: Decimal(str(round(random.uniform(0.5, 1.5), 6))) for code in exchanged_currencies}
+        logger.debug(f"Mock rates generated: {mock_rates} for {source_currency}")
+        return mock_rates
+
+
+def convert_amount(rate, amount):
+    """Convert ``amount`` at ``rate`` with Decimal arithmetic."""
+    return (Decimal(str(rate)) * Decimal(str(amount))).quantize(CONVERTED_AMOUNT_PLACES)
+
+
+# Provider implementations by Providers.provider_name; rows without one are skipped, never served by the mock.
+# Extra implementations are plugged in through PROVIDER_REGISTRY['CLASSES'] without touching this table.
+PROVIDER_CLASSES = {
+    "CurrencyBeacon": CurrencyBeacon,
+    "Mock": MockCurrencyProvider,
+}
+
+
+def provider_classes():
+    classes = dict(PROVIDER_CLASSES)
+    for provider_name, class_path in settings.PROVIDER_REGISTRY.get('CLASSES', {}).items():
+        classes[provider_name] = import_string(class_path)
+    return classes
+
+
+def build_provider(provider_data, classes=None):
+    """The provider instance of a Providers row, or ``None`` when no implementation is mapped to its name."""
+    provider_class = (classes or provider_classes()).get(provider_data.provider_name)
+    return provider_class(provider_data) if provider_class else None
+
+
+def quota_limits(provider_data):
+    """Keyword arguments of ``provider_quota.acquire`` for a Providers row."""
+    return {"requests_per_second": provider_data.requests_per_second, "daily_quota": provider_data.daily_quota}
+
+
+class ProviderRegistry:
+    """
+    Active providers, built once per process and shared by every conversion. Providers that don't
+    serve real rates (the mock) are left out, so they never end up in the failover chain.
+
+    Rows are loaded with one query on first use and reloaded after an admin change (the Providers
+    signals call ``invalidate``) or once ``PROVIDER_REGISTRY['REFRESH_INTERVAL']`` seconds have passed,
+    which is how other worker processes pick the change up. Between reloads a lookup is a dict access.
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.PROVIDER_REGISTRY
+        self.refresh_interval = config.get('REFRESH_INTERVAL', 60)
+        self._providers = None
+        self._limits = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        classes = provider_classes()
+        providers, limits = {}, {}
+        for provider_data in Providers.objects.filter(is_active=True).order_by('priority'):
+            limits[provider_data.provider_name] = quota_limits(provider_data)
+            try:
+                provider_instance = build_provider(provider_data, classes)
+            except Exception as e:
+                logger.error(f"Error building provider {provider_data.provider_name}: {e}")
+                continue
+            if provider_instance is None:
+                logger.error(f"Skipping provider {provider_data.provider_name}: no implementation in PROVIDER_CLASSES or PROVIDER_REGISTRY['CLASSES']")
+                continue
+            if not provider_instance.SERVES_REAL_RATES:
+                logger.info(f"Skipping provider {provider_data.provider_name}: {type(provider_instance).__name__} does not serve real rates")
+                continue
+            providers[provider_data.provider_name] = provider_instance
+        with self._lock:
+            self._providers, self._limits, self._loaded_at = providers, limits, time.monotonic()
+        logger.debug(f"Provider registry loaded: {list(providers)}")
+        return providers
+
+    def is_stale(self):
+        return self._providers is None or (self.refresh_interval and time.monotonic() - self._loaded_at > self.refresh_interval)
+
+    async def aproviders(self):
+        """``{provider_name: CurrencyProvider}`` of the active providers in priority order."""
+        providers = self._providers
+        if self.is_stale():
+            providers = await sync_to_async(self.load)()
+        return providers
+
+    async def aget(self, provider_name):
+        providers = await self.aproviders()
+        if provider_name not in providers:
+            raise Providers.DoesNotExist(f"No active provider named '{provider_name}'.")
+        return providers[provider_name]
+
+    async def alimits(self, provider_name):
+        """``quota_limits`` of an active provider, ``{}`` (unlimited) for anything else."""
+        await self.aproviders()
+        return self._limits.get(provider_name, {})
+
+    def invalidate(self):
+        with self._lock:
+            self._providers = None
+
+
+provider_registry = ProviderRegistry()
+
+
+class ProviderUnavailableError(Exception):
+    """Every provider of the chain failed, timed out, was out of quota or had its circuit open."""
+
+
+def describe_error(error):
+    """Short reason for breaker state and failover messages; httpx errors carry the URL, which holds the API key."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    if isinstance(error, httpx.HTTPError):
+        return type(error).__name__
+    return str(error) or type(error).__name__
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    While ``closed`` every call goes through. ``FAILURE_THRESHOLD`` failures in a row, a call slower
+    than ``SLOW_CALL_THRESHOLD`` seconds counting as one, open it and the provider is skipped. After
+    ``RESET_TIMEOUT`` seconds it turns ``half_open`` and lets a single probe through, which closes it
+    again on success or reopens it for another period on failure.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, provider_name, failure_threshold=5, slow_call_threshold=3, reset_timeout=30):
+        self.provider_name = provider_name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error = None
+        self.last_latency = None
+        self.changed_at = datetime.now()
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
 
-async def get_exchange_rate_data(source_currency: str, exchanged_currency: str, amount: str, valuation_date: str, provider_name: str):
+    def record(self, latency, error=None):
+        """Record the outcome of a call let through by ``allow``; a successful but slow call counts as a failure."""
+        with self._lock:
+            self._probing = False
+            self.last_latency = round(latency, 3)
+            if error is None and latency > self.slow_call_threshold:
+                error = f"slow call ({latency:.2f}s)"
+            if error is None:
+                self.failures = 0
+                if self.state != self.CLOSED:
+                    self._transition(self.CLOSED)
+                return
+            self.failures += 1
+            self.last_error = error if isinstance(error, str) else describe_error(error)
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._transition(self.OPEN)
+
+    def release(self):
+        """Give back a half-open probe whose call was cancelled before it had an outcome."""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        logger.warning(f"Circuit breaker for {self.provider_name}: {self.state} -> {state} (failures: {self.failures}, last error: {self.last_error})")
+        self.state = state
+        self.changed_at = datetime.now()
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "last_error": self.last_error,
+                "last_latency": self.last_latency,
+                "changed_at": self.changed_at.isoformat(timespec="seconds"),
+            }
+
+
+class HedgeBudget:
+    """
+    Caps hedged calls at ``ratio`` of primary calls: every primary call earns ``ratio`` of a credit,
+    a hedge spends a whole one, and at most ``burst`` credits are saved up for a slow spell.
+    """
+
+    def __init__(self, ratio, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = 0.0
+        self.primary_calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.primary_calls += 1
+            self.credits = min(self.burst, self.credits + self.ratio)
+
+    def spend(self):
+        with self._lock:
+            if self.credits < 1:
+                return False
+            self.credits -= 1
+            self.hedges += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"primary_calls": self.primary_calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "credits": round(self.credits, 2)}
+
+
+class ProviderChain:
+    """
+    Active providers tried in ``Providers.priority`` order, the requested one first, each under
+    its own timeout (``PROVIDER_FAILOVER['TIMEOUTS']``) and circuit breaker. Breakers live for the
+    process and outlast registry reloads.
+
+    With ``PROVIDER_HEDGING['ENABLED']``, a provider that has not answered within the
+    ``PERCENTILE`` of its recent latencies gets a duplicate call to the next provider of the chain;
+    the first valid answer wins and the other call is cancelled. Hedges are capped at
+    ``MAX_HEDGE_RATIO`` of calls by a ``HedgeBudget``.
+    """
+
+    def __init__(self, registry, config=None, hedging=None):
+        config = config or settings.PROVIDER_FAILOVER
+        hedging = hedging or settings.PROVIDER_HEDGING
+        self.registry = registry
+        self.default_timeout = config.get('TIMEOUT', 4)
+        self.timeouts = config.get('TIMEOUTS', {})
+        self.breaker_options = {
+            'failure_threshold': config.get('FAILURE_THRESHOLD', 5),
+            'slow_call_threshold': config.get('SLOW_CALL_THRESHOLD', 3),
+            'reset_timeout': config.get('RESET_TIMEOUT', 30),
+        }
+        self.hedging = hedging.get('ENABLED', False)
+        self.hedge_percentile = hedging.get('PERCENTILE', 95)
+        self.hedge_min_delay = hedging.get('MIN_DELAY', 0.05)
+        self.hedge_min_samples = hedging.get('MIN_SAMPLES', 50)
+        self.latency_window = hedging.get('LATENCY_WINDOW', 500)
+        self.hedge_budget = HedgeBudget(hedging.get('MAX_HEDGE_RATIO', 0.05), hedging.get('MAX_HEDGE_BURST', 10))
+        self.breakers = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider_name):
+        with self._lock:
+            if provider_name not in self.breakers:
+                self.breakers[provider_name] = CircuitBreaker(provider_name, **self.breaker_options)
+            return self.breakers[provider_name]
+
+    def timeout_for(self, provider_name):
+        return self.timeouts.get(provider_name, self.default_timeout)
+
+    def record_latency(self, provider_name, latency):
+        with self._lock:
+            if provider_name not in self.latencies:
+                self.latencies[provider_name] = deque(maxlen=self.latency_window)
+            self.latencies[provider_name].append(latency)
+
+    def hedge_delay(self, provider_name):
+        """Seconds to wait for ``provider_name`` before hedging, or ``None`` until enough latencies were observed."""
+        with self._lock:
+            samples = sorted(self.latencies.get(provider_name, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))])
+
+    async def aproviders(self, provider_name=None):
+        """``[(provider_name, CurrencyProvider)]`` in the order they are tried."""
+        providers = list((await self.registry.aproviders()).items())
+        return sorted(providers, key=lambda item: item[0] != provider_name)
+
+    async def call(self, provider_name, provider_instance, source_currency, exchanged_currencies, valuation_date):
+        """One provider call under its quota and timeout, recorded on its breaker and latency window."""
+        breaker = self.breaker(provider_name)
+        timeout = self.timeout_for(provider_name)
+        try:
+            await provider_quota.acquire(provider_name, priority=INTERACTIVE, **await self.registry.alimits(provider_name))
+        except BaseException:
+            # Our own quota says nothing about the provider's health
+            breaker.release()
+            raise
+        started = time.monotonic()
+        try:
+            rates = await asyncio.wait_for(provider_instance.get_exchange_rates(source_currency, exchanged_currencies, valuation_date), timeout)
+        except asyncio.TimeoutError:
+            breaker.record(time.monotonic() - started, f"timed out after {timeout}s")
+            raise asyncio.TimeoutError(f"timed out after {timeout}s")
+        except asyncio.CancelledError:
+            # Lost a hedge race or the caller's deadline ran out: free a half-open probe without judging the provider
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record(time.monotonic() - started, e)
+            raise
+        latency = time.monotonic() - started
+        breaker.record(latency)
+        self.record_latency(provider_name, latency)
+        return rates
+
+    async def get_exchange_rates(self, source_currency: str, exchanged_currencies: list, valuation_date: datetime, provider_name: str = None):
+        attempts = []
+        providers = iter(await self.aproviders(provider_name))
+
+        def next_provider():
+            for name, provider_instance in providers:
+                breaker = self.breaker(name)
+                if breaker.allow():
+                    return name, provider_instance
+                attempts.append(f"{name}: circuit {breaker.state}")
+            return None
+
+        racing, spare = {}, None
+        try:
+            candidate = next_provider()
+            while candidate:
+                name, provider_instance = candidate
+                racing[asyncio.create_task(self.call(name, provider_instance, source_currency, exchanged_currencies, valuation_date))] = name
+                self.hedge_budget.earn()
+                hedge_delay = self.hedge_delay(name) if self.hedging else None
+                if hedge_delay is not None:
+                    done, _ = await asyncio.wait(racing, timeout=hedge_delay)
+                    if not done:
+                        # Only a hedge that is actually launched spends budget
+                        hedge = next_provider()
+                        if hedge and self.hedge_budget.spend():
+                            logger.info(f"Hedging {source_currency} rates: {name} slower than {hedge_delay:.3f}s, also asking {hedge[0]}")
+                            racing[asyncio.create_task(self.call(*hedge, source_currency, exchanged_currencies, valuation_date))] = hedge[0]
+                        else:
+                            # Out of budget: the provider stays next in line for failover
+                            spare = hedge
+
+                while racing:
+                    done, _ = await asyncio.wait(racing, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        served_by = racing.pop(task)
+                        if task.exception() is not None:
+                            attempts.append(f"{served_by}: {describe_error(task.exception())}")
+                            continue
+                        if served_by != name:
+                            self.hedge_budget.won()
+                        if provider_name and served_by != provider_name:
+                            logger.warning(f"Served {source_currency} rates from {served_by} instead of {provider_name}")
+                        return task.result()
+                candidate, spare = spare or next_provider(), None
+        finally:
+            # The losing call of a hedge, or every call when our own caller gave up
+            for task in racing:
+                task.cancel()
+            if racing:
+                await asyncio.gather(*racing, return_exceptions=True)
+            if spare:
+                # Never called, so hand back a half-open probe its breaker let through
+                self.breaker(spare[0]).release()
+        raise ProviderUnavailableError(f"No provider could serve {source_currency} rates: {'; '.join(attempts) or 'no active providers'}")
+
+    async def status(self):
+        """Chain order with each provider's timeout, hedge delay and breaker state, to see why traffic moved."""
+        return [
+            {"provider": name, "timeout": self.timeout_for(name), "hedge_delay": self.hedge_delay(name), "requests_today": await provider_quota.usage(name), **await self.registry.alimits(name), **self.breaker(name).snapshot()}
+            for name, _ in await self.aproviders()
+        ]
+
+
+provider_chain = ProviderChain(provider_registry)
+
+
+async def get_exchange_rates_data(source_currency: str, exchanged_currencies: list, valuation_date: str, provider_name: str):
+    """
+    Fetch the rates of every target currency for one source currency and date with a single upstream call,
+    from ``provider_name`` or, when it fails or its circuit is open, the next active provider by priority.
+    """
     try:
         logger.info("Fetching exchange rate data...")
-        logger.debug(f"Source: {source_currency}, Exchanged: {exchanged_currency}, Amount: {amount}, Valuation Date: {valuation_date}, Provider: {provider_name}")
-        
-        # Use sync_to_async to wrap the ORM call
-        selected_provider = await sync_to_async(lambda: Providers.objects.get(provider_name=provider_name, is_active=True))()
-        
-        if selected_provider.provider_name == "CurrencyBeacon":
-            provider_instance = CurrencyBeacon(selected_provider)
-        else:
-            provider_instance = MockCurrencyProvider(selected_provider)  # You may choose to use data if needed
-        
-        logger.debug(f"Selected Provider: {selected_provider.provider_name}")
+        logger.debug(f"Source: {source_currency}, Exchanged: {exchanged_currencies}, Valuation Date: {valuation_date}, Provider: {provider_name}")
+
         valuation_date_obj = datetime.strptime(valuation_date, '%Y-%m-%d')
-        return await provider_instance.get_exchange_rate(source_currency, exchanged_currency, valuation_date_obj, amount)
+        return await provider_chain.get_exchange_rates(source_currency, exchanged_currencies, valuation_date_obj, provider_name)
     except Exception as e:
         logger.error(f"Error in getting exchange rate data: {e}")
         raise  # Optionally re-raise the exception for further handling
+
+
+async def get_exchange_rates_concurrently(source_currency: str, exchanged_currencies: list, valuation_date: str, provider_name: str, max_concurrency: int = None, deadline: float = None):
+    """
+    Fetch the rate vector for several target currencies. Targets are split into chunks of
+    ``CONVERSION_FETCH['SYMBOLS_PER_CALL']`` symbols, one upstream call per chunk, with at most
+    ``max_concurrency`` calls in flight. Returns ``{code: Decimal | Exception}``; targets whose
+    call is still running when ``deadline`` seconds pass are reported as ``asyncio.TimeoutError``.
+    """
+    max_concurrency = max_concurrency or settings.CONVERSION_FETCH['MAX_CONCURRENCY']
+    deadline = deadline or settings.CONVERSION_FETCH['DEADLINE']
+    symbols_per_call = settings.CONVERSION_FETCH['SYMBOLS_PER_CALL']
+    if not exchanged_currencies:
+        return {}
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(chunk):
+        async with semaphore:
+            return await get_exchange_rates_data(source_currency, chunk, valuation_date, provider_name)
+
+    chunks = [tuple(exchanged_currencies[i:i + symbols_per_call]) for i in range(0, len(exchanged_currencies), symbols_per_call)]
+    tasks = {chunk: asyncio.create_task(fetch(list(chunk))) for chunk in chunks}
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"{len(pending)} exchange rate fetches for {source_currency} did not finish within {deadline}s")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    outcomes = {}
+    for chunk, task in tasks.items():
+        for exchanged_currency in chunk:
+            if task in pending:
+                outcomes[exchanged_currency] = asyncio.TimeoutError(f"Timed out fetching {source_currency} to {exchanged_currency}")
+            elif task.exception() is not None:
+                outcomes[exchanged_currency] = task.exception()
+            elif exchanged_currency in task.result():
+                outcomes[exchanged_currency] = task.result()[exchanged_currency]
+            else:
+                outcomes[exchanged_currency] = ValueError(f"No rate available for {source_currency} to {exchanged_currency}.")
+    return outcomes
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import weakref
+
+import httpx
+from django.conf import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class ProviderHTTPClients:
+    """
+    Long-lived, keep-alive HTTP clients with one connection pool per provider.
+
+    Async clients are bound to the event loop that created them, so they are kept
+    per loop: the ASGI worker reuses one set for its whole lifetime while management
+    commands (which run their own ``asyncio.run`` loop) get a fresh set and close it
+    when they are done.
+    """
+
+    def __init__(self):
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def client_options(provider_name):
+        config = dict(settings.PROVIDER_HTTP)
+        config.update(config.pop("PROVIDERS", {}).get(provider_name, {}))
+        return {
+            "limits": httpx.Limits(
+                max_connections=config["MAX_CONNECTIONS"],
+                max_keepalive_connections=config["MAX_KEEPALIVE_CONNECTIONS"],
+                keepalive_expiry=config["KEEPALIVE_EXPIRY"],
+            ),
+            "timeout": httpx.Timeout(config["TIMEOUT"], connect=config["CONNECT_TIMEOUT"]),
+        }
+
+    def get_async_client(self, provider_name) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.setdefault(loop, {})
+        client = clients.get(provider_name)
+        if client is None or client.is_closed:
+            logger.debug(f"Opening async HTTP pool for provider {provider_name}")
+            client = clients[provider_name] = httpx.AsyncClient(**self.client_options(provider_name))
+        return client
+
+    async def aclose(self):
+        """Close the async clients of the running loop."""
+        clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for provider_name, client in clients.items():
+            logger.debug(f"Closing async HTTP pool for provider {provider_name}")
+            await client.aclose()
+
+
+provider_http = ProviderHTTPClients()
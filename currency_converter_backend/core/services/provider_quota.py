@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Conversions and timeseries requests are served first, backfills take what they leave
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class QuotaExceededError(Exception):
+    """No upstream slot of the provider became free within the caller's wait."""
+
+
+class ProviderQuota:
+    """
+    Upstream allowance of each provider, shared by every process through the cache ``PROVIDER_QUOTA['ALIAS']``.
+
+    ``Providers.requests_per_second`` is enforced as a counter per window and ``Providers.daily_quota``
+    as a counter per UTC day, both taken with the cache's atomic ``incr``. Batch callers may only use
+    the part of each window and day left after ``INTERACTIVE_RESERVE`` (rounded up, so the reserve is
+    at least one request); windows are long enough to hold ``1 / INTERACTIVE_RESERVE`` requests so the
+    reserve survives the rounding at low rates. A daily quota too small to leave batch callers
+    anything after the reserve is interactive-only. Batch callers wait for the next window (up to
+    ``BATCH_MAX_WAIT``) instead of sending requests the provider would answer with 429.
+    Interactive callers wait at most ``INTERACTIVE_MAX_WAIT`` and then get a ``QuotaExceededError``.
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.PROVIDER_QUOTA
+        self.alias = config.get("ALIAS", "default")
+        self.key_prefix = config.get("KEY_PREFIX", "provider-quota")
+        self.interactive_reserve = config.get("INTERACTIVE_RESERVE", 0.2)
+        self.max_waits = {INTERACTIVE: config.get("INTERACTIVE_MAX_WAIT", 1), BATCH: config.get("BATCH_MAX_WAIT")}
+        self.daily_poll_interval = config.get("DAILY_POLL_INTERVAL", 60)
+        # Requests a rate window must hold for the reserve to be a whole request of it
+        self.min_window_requests = math.ceil(1 / self.interactive_reserve) if self.interactive_reserve else 1
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def allowance(self, limit, priority):
+        if priority == INTERACTIVE or not self.interactive_reserve:
+            return limit
+        return max(0, limit - math.ceil(round(limit * self.interactive_reserve, 9)))
+
+    def rate_window(self, requests_per_second):
+        """``(seconds, requests)`` of the window ``requests_per_second`` is counted over."""
+        window = max(1.0, self.min_window_requests / requests_per_second)
+        return window, max(1, round(requests_per_second * window))
+
+    async def acquire(self, provider_name, requests_per_second=None, daily_quota=None, priority=INTERACTIVE):
+        """Wait for an upstream slot of ``provider_name``; raises ``QuotaExceededError`` once the caller's wait runs out."""
+        if not requests_per_second and not daily_quota:
+            return
+        loop = asyncio.get_running_loop()
+        max_wait = self.max_waits[priority]
+        give_up_at = None if max_wait is None else loop.time() + max_wait
+        while True:
+            retry_in, reason = await self.try_acquire(provider_name, requests_per_second, daily_quota, priority)
+            if retry_in is None:
+                return
+            if give_up_at is not None and loop.time() + retry_in > give_up_at:
+                raise QuotaExceededError(f"{provider_name} {reason} for {priority} requests")
+            await asyncio.sleep(retry_in)
+
+    async def try_acquire(self, provider_name, requests_per_second, daily_quota, priority):
+        """Take a slot if one is free. Returns ``(None, None)`` or ``(seconds to wait, reason)``."""
+        now = time.time()
+        try:
+            if daily_quota:
+                today = datetime.fromtimestamp(now, timezone.utc).date()
+                day_key = f"{self.key_prefix}:{provider_name}:day:{today.isoformat()}"
+                if not await self.take(day_key, self.allowance(daily_quota, priority), 2 * 86400):
+                    until_tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time(), timezone.utc).timestamp() - now
+                    return min(until_tomorrow, self.daily_poll_interval), "daily quota used up"
+            if requests_per_second:
+                window, window_requests = self.rate_window(requests_per_second)
+                window_start = math.floor(now / window)
+                window_key = f"{self.key_prefix}:{provider_name}:window:{window:g}:{window_start}"
+                if not await self.take(window_key, self.allowance(window_requests, priority), math.ceil(window) + 1):
+                    if daily_quota:
+                        await self.shared.adecr(day_key)
+                    return (window_start + 1) * window - now, "rate limit reached"
+        except Exception as e:
+            # An unreachable shared cache must not stop conversions; the provider's own limits still apply
+            logger.error(f"Error checking the quota of {provider_name}: {e}")
+        return None, None
+
+    async def take(self, key, allowance, timeout):
+        await self.shared.aadd(key, 0, timeout=timeout)
+        if await self.shared.aincr(key) <= allowance:
+            return True
+        await self.shared.adecr(key)
+        return False
+
+    async def usage(self, provider_name):
+        """Requests counted against ``provider_name`` today (UTC)."""
+        try:
+            return await self.shared.aget(f"{self.key_prefix}:{provider_name}:day:{datetime.now(timezone.utc).date().isoformat()}", 0)
+        except Exception as e:
+            logger.error(f"Error reading the quota usage of {provider_name}: {e}")
+            return None
+
+
+provider_quota = ProviderQuota()
@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.services.shared_cache import is_process_local
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """Bounded, thread-safe in-process LRU cache with optional per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RateCache:
+    """
+    Two-tier cache for exchange rates keyed on (source, target, valuation_date).
+
+    Tier 1 is a per-process LRU, tier 2 is the Django cache configured by
+    ``RATE_CACHE['ALIAS']`` so that workers can share entries. Historical
+    rates are kept for ``HISTORICAL_TTL``, rates for today (or later) use
+    ``TODAY_TTL``. Local entries are additionally capped at ``LOCAL_TTL``
+    because writes made by other processes (e.g. the backfill command) can
+    only invalidate tier 2; while tier 2 is itself per-process (no shared
+    backend configured) the same cap applies to it.
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.RATE_CACHE
+        self.alias = config.get("ALIAS", "default")
+        self.key_prefix = config.get("KEY_PREFIX", "rate")
+        self.today_ttl = config.get("TODAY_TTL", 300)
+        self.historical_ttl = config.get("HISTORICAL_TTL", 86400)
+        self.local_ttl = config.get("LOCAL_TTL", 60)
+        self.empty_ttl = config.get("EMPTY_TTL", 86400)
+        self.local = LocalLRUCache(config.get("LOCAL_MAX_ENTRIES", 10000))
+        self._counters = {"local_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0, "invalidations": 0}
+        self._counters_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, source_currency, exchanged_currency, valuation_date):
+        return f"{self.key_prefix}:{source_currency}:{exchanged_currency}:{_as_date(valuation_date).isoformat()}"
+
+    def timeout_for(self, valuation_date):
+        """Historical dates rarely change and are kept for a day, today's rate gets a short TTL."""
+        timeout = self.historical_ttl if _as_date(valuation_date) < date.today() else self.today_ttl
+        if is_process_local(self.alias):
+            return min(timeout, self.local_ttl)
+        return timeout
+
+    def local_timeout_for(self, valuation_date):
+        return min(self.timeout_for(valuation_date), self.local_ttl)
+
+    def _count(self, name, value=1):
+        if value:
+            with self._counters_lock:
+                self._counters[name] += value
+
+    def _split_local(self, source_currency, exchanged_currencies, valuation_date):
+        found, pending = {}, {}
+        for code in exchanged_currencies:
+            key = self.make_key(source_currency, code, valuation_date)
+            value = self.local.get(key)
+            if value is _MISSING:
+                pending[key] = code
+            else:
+                found[code] = value
+        self._count("local_hits", len(found))
+        return found, pending
+
+    def _merge_shared(self, found, pending, shared_values, valuation_date):
+        timeout = self.local_timeout_for(valuation_date)
+        for key, value in shared_values.items():
+            self.local.set(key, value, timeout)
+            found[pending[key]] = value
+        self._count("shared_hits", len(shared_values))
+        self._count("misses", len(pending) - len(shared_values))
+        return found
+
+    async def aget_many(self, source_currency, exchanged_currencies, valuation_date):
+        """Return ``{target_code: Decimal}`` for every target found in either tier."""
+        found, pending = self._split_local(source_currency, exchanged_currencies, valuation_date)
+        if not pending:
+            return found
+        shared_values = await self.shared.aget_many(list(pending))
+        return self._merge_shared(found, pending, shared_values, valuation_date)
+
+    def _prepare(self, source_currency, rates, valuation_date):
+        timeout = self.timeout_for(valuation_date)
+        entries = {self.make_key(source_currency, code, valuation_date): Decimal(str(rate)) for code, rate in rates.items()}
+        local_timeout = self.local_timeout_for(valuation_date)
+        for key, value in entries.items():
+            self.local.set(key, value, local_timeout)
+        self._count("sets", len(entries))
+        return entries, timeout
+
+    async def aset_many(self, source_currency, rates, valuation_date):
+        """Store ``{target_code: rate}`` for one source currency and date in both tiers."""
+        entries, timeout = self._prepare(source_currency, rates, valuation_date)
+        if entries:
+            await self.shared.aset_many(entries, timeout=timeout)
+
+    def invalidate(self, source_currency, exchanged_currency, valuation_date):
+        key = self.make_key(source_currency, exchanged_currency, valuation_date)
+        self.local.delete(key)
+        try:
+            self.shared.delete(key)
+        except Exception as e:
+            logger.error(f"Error invalidating rate cache key {key}: {e}")
+        self._count("invalidations")
+
+    def invalidate_many(self, entries):
+        """Invalidate ``(source, target, valuation_date)`` entries written in bulk, which bypasses model signals."""
+        keys = [self.make_key(source_currency, exchanged_currency, valuation_date) for source_currency, exchanged_currency, valuation_date in entries]
+        for key in keys:
+            self.local.delete(key)
+        try:
+            self.shared.delete_many(keys)
+        except Exception as e:
+            logger.error(f"Error invalidating {len(keys)} rate cache keys: {e}")
+        self._count("invalidations", len(keys))
+
+    def make_empty_key(self, source_currency, exchanged_currency, valuation_date):
+        return f"{self.key_prefix}-empty:{source_currency}:{exchanged_currency}:{_as_date(valuation_date).isoformat()}"
+
+    async def aget_empty_dates(self, source_currency, dates_by_code):
+        """
+        ``{code: {valuation_date}}`` of the given days the provider was already asked for and had no rate,
+        so range requests don't go upstream again for them until the marker expires.
+        """
+        keys = {self.make_empty_key(source_currency, code, valuation_date): (code, valuation_date) for code, dates in dates_by_code.items() for valuation_date in dates}
+        if not keys:
+            return {}
+        try:
+            marked = await self.shared.aget_many(list(keys))
+        except Exception as e:
+            logger.error(f"Error reading {len(keys)} empty-day markers: {e}")
+            return {}
+        empty_dates = {}
+        for key in marked:
+            code, valuation_date = keys[key]
+            empty_dates.setdefault(code, set()).add(valuation_date)
+        return empty_dates
+
+    async def aset_empty_dates(self, source_currency, dates_by_code):
+        """Mark days the provider answered without a rate, for ``EMPTY_TTL`` seconds (``TODAY_TTL`` for today, which may still be published)."""
+        entries_by_timeout = {}
+        for code, dates in dates_by_code.items():
+            for valuation_date in dates:
+                timeout = self.today_ttl if _as_date(valuation_date) >= date.today() else self.empty_ttl
+                entries_by_timeout.setdefault(timeout, {})[self.make_empty_key(source_currency, code, valuation_date)] = True
+        try:
+            for timeout, entries in entries_by_timeout.items():
+                await self.shared.aset_many(entries, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Error storing empty-day markers: {e}")
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        lookups = counters["local_hits"] + counters["shared_hits"] + counters["misses"]
+        counters["hit_ratio"] = round((counters["local_hits"] + counters["shared_hits"]) / lookups, 4) if lookups else 0.0
+        counters["local_entries"] = len(self.local)
+        return counters
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+rate_cache = RateCache()
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+from collections import defaultdict
+from decimal import Decimal, localcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+
+from core.models import Currency, CurrencyExchangeRate, CurrencyExchangeRateRollup
+from core.services.exchange_rate_service import get_exchange_rates_concurrently
+from core.services.rate_cache import rate_cache
+from core.services.rate_store import refresh_rollups
+from core.services.single_flight import FlightAbandoned, single_flight
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Matches CurrencyExchangeRate.rate_value (decimal_places=6)
+RATE_PLACES = Decimal("0.000001")
+
+
+class RateEngine:
+    """
+    Cross-rate triangulation over a single pivot currency.
+
+    Only ``pivot -> code`` rows are stored, one per currency and day. Any other
+    pair is derived on demand as ``rate(pivot -> target) / rate(pivot -> source)``,
+    computed at 28 significant digits and quantized to the column precision.
+    """
+
+    pivot = settings.RATE_ENGINE["PIVOT_CURRENCY"]
+
+    @classmethod
+    def pivot_codes(cls, *codes):
+        """Currencies whose pivot rate is needed to derive pairs between ``codes``."""
+        return sorted({code for code in codes if code != cls.pivot})
+
+    @classmethod
+    def cross_rate(cls, pivot_rates, source_currency, exchanged_currency):
+        """
+        Derive ``source -> exchanged`` from ``{code: rate(pivot -> code)}``.
+        Returns ``None`` when either leg is missing.
+        """
+        if source_currency == exchanged_currency:
+            return Decimal(1).quantize(RATE_PLACES)
+        source_rate = Decimal(1) if source_currency == cls.pivot else pivot_rates.get(source_currency)
+        exchanged_rate = Decimal(1) if exchanged_currency == cls.pivot else pivot_rates.get(exchanged_currency)
+        if source_rate is None or exchanged_rate is None or not source_rate:
+            return None
+        with localcontext() as ctx:
+            ctx.prec = 28
+            return (Decimal(exchanged_rate) / Decimal(source_rate)).quantize(RATE_PLACES)
+
+    @classmethod
+    def pivot_rates_queryset(cls, codes, **date_filter):
+        return CurrencyExchangeRate.objects.filter(source_currency__code=cls.pivot, exchanged_currency__code__in=codes, **date_filter)
+
+    @classmethod
+    def load_pivot_rates(cls, codes, valuation_date):
+        """``{code: rate(pivot -> code)}`` stored for ``valuation_date``."""
+        pivot_rates = {}
+        for code, rate in cls.pivot_rates_queryset(codes, valuation_date=valuation_date).values_list("exchanged_currency__code", "rate_value"):
+            pivot_rates.setdefault(code, rate)
+        return pivot_rates
+
+    @classmethod
+    async def aload_pivot_series(cls, codes, start_date, end_date):
+        """``{valuation_date: {code: rate(pivot -> code)}}`` stored between ``start_date`` and ``end_date``."""
+        by_date = defaultdict(dict)
+        rows = cls.pivot_rates_queryset(codes, valuation_date__range=[start_date, end_date]).values_list("valuation_date", "exchanged_currency__code", "rate_value")
+        async for valuation_date, code, rate in rows:
+            by_date[valuation_date].setdefault(code, rate)
+        return by_date
+
+    @classmethod
+    async def aload_pivot_rollups(cls, codes, resolution, start_date, end_date):
+        """
+        ``({period_start: {code: close}}, {(code, period_start): days})`` from the pivot rollups of periods
+        starting between ``start_date`` and ``end_date``.
+        """
+        closes_by_period, days = defaultdict(dict), {}
+        rows = CurrencyExchangeRateRollup.objects.filter(source_currency__code=cls.pivot, exchanged_currency__code__in=codes, resolution=resolution, period_start__range=[start_date, end_date]).values_list(
+            "period_start", "exchanged_currency__code", "close_value", "days"
+        )
+        async for start, code, close_value, period_days in rows:
+            closes_by_period[start][code] = close_value
+            days[(code, start)] = period_days
+        return closes_by_period, days
+
+    @classmethod
+    def save_pivot_rates(cls, entries):
+        """
+        Store new pivot rows with one bulk insert. If the batch conflicts, fall back to
+        row-by-row saves. Returns the saved entries and the codes that conflicted.
+        """
+        try:
+            CurrencyExchangeRate.objects.bulk_create(entries)
+            # Row-by-row saves below refresh through the post_save signal, the bulk insert has to do it itself
+            refresh_rollups((cls.pivot, entry.exchanged_currency.code, entry.valuation_date) for entry in entries)
+            return entries, []
+        except IntegrityError:
+            saved_entries, conflicts = [], []
+            for entry in entries:
+                try:
+                    entry.save()
+                    saved_entries.append(entry)
+                except IntegrityError:
+                    conflicts.append(entry.exchanged_currency.code)
+            return saved_entries, conflicts
+
+    @classmethod
+    async def aresolve_pivot_rates(cls, codes, valuation_date, provider_name):
+        """
+        Resolve ``rate(pivot -> code)`` for ``codes`` on ``valuation_date`` from the rate cache,
+        then the database (one query), then the provider (one rate-vector call for the pivot).
+
+        Returns ``(pivot_rates, origins, errors)`` where ``origins`` maps each resolved code to
+        ``"Cache"``, ``"Database"`` or ``"API"`` and ``errors`` maps unresolved codes to the
+        exception that prevented it.
+        """
+        pivot_rates = await rate_cache.aget_many(cls.pivot, codes, valuation_date)
+        origins = dict.fromkeys(pivot_rates, "Cache")
+        errors = {}
+
+        pending_codes = [code for code in codes if code not in pivot_rates]
+        if pending_codes:
+            db_rates = await sync_to_async(cls.load_pivot_rates)(pending_codes, valuation_date)
+            if db_rates:
+                await rate_cache.aset_many(cls.pivot, db_rates, valuation_date)
+                pivot_rates.update(db_rates)
+                origins.update(dict.fromkeys(db_rates, "Database"))
+
+        missing_codes = [code for code in pending_codes if code not in pivot_rates]
+        if not missing_codes:
+            return pivot_rates, origins, errors
+
+        # Concurrent misses of the same rate share one provider call and one write: this request
+        # leads the codes nobody else in the worker is fetching and waits for the rest. Codes whose
+        # leader was cancelled before it had an outcome are claimed again, so a follower takes over.
+        while missing_codes:
+            flight_keys = {code: (provider_name, cls.pivot, code, str(valuation_date)) for code in missing_codes}
+            leading, following = single_flight.claim(flight_keys.values())
+            lead_codes = [code for code in missing_codes if flight_keys[code] in leading]
+            try:
+                fetched_rates, fetched_origins, fetch_errors = await cls.afetch_pivot_rates(lead_codes, valuation_date, provider_name) if lead_codes else ({}, {}, {})
+            except Exception as e:
+                single_flight.resolve(dict.fromkeys(leading, e))
+                raise
+            except BaseException:
+                # Our client went away (CancelledError); the followers still want the rate
+                single_flight.resolve(dict.fromkeys(leading, FlightAbandoned(f"The request fetching {cls.pivot} rates on {valuation_date} was cancelled")))
+                raise
+            single_flight.resolve({flight_keys[code]: fetched_rates.get(code, fetch_errors.get(code)) for code in lead_codes})
+            pivot_rates.update(fetched_rates)
+            origins.update(fetched_origins)
+            errors.update(fetch_errors)
+
+            missing_codes = []
+            if following:
+                shared_outcomes = await single_flight.wait(following)
+                for code, key in flight_keys.items():
+                    outcome = shared_outcomes.get(key)
+                    if isinstance(outcome, FlightAbandoned):
+                        missing_codes.append(code)
+                    elif isinstance(outcome, BaseException):
+                        errors[code] = outcome
+                    elif outcome is not None:
+                        pivot_rates[code] = outcome
+                        origins[code] = "API"
+
+        return pivot_rates, origins, errors
+
+    @classmethod
+    async def afetch_pivot_rates(cls, codes, valuation_date, provider_name):
+        """
+        Fetch and store the pivot rates of ``codes`` once across workers. Codes another worker
+        holds the lock of are waited for in the shared rate cache and only fetched here if it
+        has not stored them when the wait runs out. Returns ``(pivot_rates, origins, errors)``.
+        """
+        flight_keys = {code: (provider_name, cls.pivot, code, str(valuation_date)) for code in codes}
+        acquired, held_elsewhere = await single_flight.aacquire(flight_keys.values())
+        try:
+            # A worker may have stored some rates between our miss and taking their lock
+            pivot_rates = await rate_cache.aget_many(cls.pivot, codes, valuation_date)
+            waiting_codes = [code for code in codes if flight_keys[code] in held_elsewhere and code not in pivot_rates]
+            if waiting_codes:
+                pivot_rates.update(await cls.await_shared_pivot_rates(waiting_codes, valuation_date))
+            origins = dict.fromkeys(pivot_rates, "Cache")
+
+            fetched_rates, fetched_origins, errors = await cls.afetch_and_save_pivot_rates([code for code in codes if code not in pivot_rates], valuation_date, provider_name)
+            pivot_rates.update(fetched_rates)
+            origins.update(fetched_origins)
+            return pivot_rates, origins, errors
+        finally:
+            await single_flight.arelease(acquired)
+
+    @classmethod
+    async def await_shared_pivot_rates(cls, codes, valuation_date):
+        """Poll the shared rate cache until the worker fetching ``codes`` stores them or ``SINGLE_FLIGHT['WAIT_TIMEOUT']`` passes."""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + single_flight.wait_timeout
+        found = {}
+        while len(found) < len(codes) and loop.time() < give_up_at:
+            await asyncio.sleep(single_flight.poll_interval)
+            found.update(await rate_cache.aget_many(cls.pivot, [code for code in codes if code not in found], valuation_date))
+        if len(found) < len(codes):
+            logger.warning(f"Gave up waiting for another worker to fetch {cls.pivot} to {[code for code in codes if code not in found]} on {valuation_date}")
+        return found
+
+    @classmethod
+    async def afetch_and_save_pivot_rates(cls, codes, valuation_date, provider_name):
+        """Ask the provider for ``codes`` (one rate-vector call for the pivot) and store the result."""
+        pivot_rates, origins, errors = {}, {}, {}
+        if not codes:
+            return pivot_rates, origins, errors
+
+        # Fetch the currency instances of every pair we still have to ask the provider for in one go
+        currencies = {currency.code: currency for currency in await sync_to_async(list)(Currency.objects.filter(code__in=codes + [cls.pivot]))}
+        for code in codes:
+            if code not in currencies:
+                errors[code] = Currency.DoesNotExist(f"Currency {code} does not exist.")
+
+        fetched_rates = await get_exchange_rates_concurrently(cls.pivot, [code for code in codes if code in currencies], valuation_date, provider_name)
+        new_entries = []
+        for code, rate in fetched_rates.items():
+            if isinstance(rate, Exception):
+                errors[code] = rate
+                continue
+            pivot_rates[code] = rate
+            origins[code] = "API"
+            new_entries.append(CurrencyExchangeRate(source_currency=currencies[cls.pivot], exchanged_currency=currencies[code], valuation_date=valuation_date, rate_value=rate))
+
+        if new_entries:
+            saved_entries, conflicts = await sync_to_async(cls.save_pivot_rates)(new_entries)
+            if conflicts:
+                # Someone else stored these first (e.g. the backfill command); serve their row
+                stored_rates = await sync_to_async(cls.load_pivot_rates)(conflicts, valuation_date)
+                for code in conflicts:
+                    if code in stored_rates:
+                        pivot_rates[code] = stored_rates[code]
+                        origins[code] = "Database"
+                    else:
+                        errors[code] = IntegrityError(f"Rate already exists for {cls.pivot} to {code} on {valuation_date}.")
+                        pivot_rates.pop(code, None)
+            await rate_cache.aset_many(cls.pivot, {entry.exchanged_currency.code: entry.rate_value for entry in saved_entries}, valuation_date)
+
+        return pivot_rates, origins, errors
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import random
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upstream responses worth retrying: throttled or a transient server-side failure
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class AsyncRateLimiter:
+    """Token bucket allowing ``rate`` acquisitions per second with bursts up to ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """Exponential backoff with full jitter, honouring a numeric ``Retry-After`` header when present."""
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
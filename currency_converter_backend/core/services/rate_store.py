@@ -0,0 +1,190 @@
+import calendar
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count
+
+from core.models import Currency, CurrencyExchangeRate, CurrencyExchangeRateRollup
+from core.services.rate_cache import rate_cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ROLLUP_RESOLUTIONS = (CurrencyExchangeRateRollup.WEEKLY, CurrencyExchangeRateRollup.MONTHLY)
+# Matches the rollup value columns (decimal_places=6)
+ROLLUP_PLACES = Decimal("0.000001")
+
+
+def load_currency_ids():
+    """In-memory ``{code: id}`` map so batches never look currencies up row by row."""
+    return dict(Currency.objects.values_list("code", "id"))
+
+
+def upsert_exchange_rates(rows, currency_ids):
+    """
+    Insert or update one batch of ``(source_code, target_code, valuation_date, rate_value)`` rows
+    with a single native upsert on the (source, target, date) unique key. Returns the rows written.
+    """
+    entries = {}
+    for source_code, target_code, valuation_date, rate_value in rows:
+        if source_code not in currency_ids or target_code not in currency_ids:
+            logger.warning(f"Skipping rate for unknown currency pair {source_code}/{target_code}")
+            continue
+        if isinstance(valuation_date, str):
+            valuation_date = date.fromisoformat(valuation_date)
+        entries[(source_code, target_code, valuation_date)] = rate_value
+    if not entries:
+        return 0
+
+    CurrencyExchangeRate.objects.bulk_create(
+        [
+            CurrencyExchangeRate(source_currency_id=currency_ids[source_code], exchanged_currency_id=currency_ids[target_code], valuation_date=valuation_date, rate_value=rate_value)
+            for (source_code, target_code, valuation_date), rate_value in entries.items()
+        ],
+        **upsert_options(CurrencyExchangeRate, ["source_currency", "exchanged_currency", "valuation_date"], ["rate_value", "updated_at"]),
+    )
+
+    # Bulk writes bypass the post_save signal, so drop the cached values and refresh the rollups explicitly
+    rate_cache.invalidate_many(entries)
+    refresh_rollups(entries)
+    return len(entries)
+
+
+def upsert_options(model, unique_fields, update_fields):
+    """``bulk_create`` arguments turning the insert into an upsert on ``unique_fields``."""
+    options = {"update_conflicts": True, "update_fields": update_fields}
+    # MySQL's ON DUPLICATE KEY UPDATE can't name the conflict target, other backends require it
+    if connections[router.db_for_write(model)].features.supports_update_conflicts_with_target:
+        options["unique_fields"] = unique_fields
+    return options
+
+
+def find_missing_dates(source_code, target_codes, start_date, end_date):
+    """
+    Dates in ``[start_date, end_date]`` lacking a stored ``source -> target`` rate for any of ``target_codes``.
+    Complete dates are found with one aggregate query.
+    """
+    complete_dates = set(
+        CurrencyExchangeRate.objects.filter(source_currency__code=source_code, exchanged_currency__code__in=target_codes, valuation_date__range=[start_date, end_date])
+        .values("valuation_date")
+        .annotate(stored=Count("exchanged_currency", distinct=True))
+        .filter(stored__gte=len(set(target_codes)))
+        .values_list("valuation_date", flat=True)
+    )
+    missing_dates = []
+    current = start_date
+    while current <= end_date:
+        if current not in complete_dates:
+            missing_dates.append(current)
+        current += timedelta(days=1)
+    return missing_dates
+
+
+def contiguous_ranges(dates, max_days=None):
+    """Split sorted ``dates`` into ``(start, end)`` runs of consecutive days, each at most ``max_days`` long."""
+    ranges = []
+    for valuation_date in dates:
+        if ranges and valuation_date - ranges[-1][1] == timedelta(days=1) and (max_days is None or (valuation_date - ranges[-1][0]).days < max_days):
+            ranges[-1][1] = valuation_date
+        else:
+            ranges.append([valuation_date, valuation_date])
+    return [tuple(date_range) for date_range in ranges]
+
+
+def period_start(valuation_date, resolution):
+    """First day of the week (Monday) or month ``valuation_date`` falls in."""
+    if resolution == CurrencyExchangeRateRollup.WEEKLY:
+        return valuation_date - timedelta(days=valuation_date.weekday())
+    return valuation_date.replace(day=1)
+
+
+def period_end(start, resolution):
+    if resolution == CurrencyExchangeRateRollup.WEEKLY:
+        return start + timedelta(days=6)
+    return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+
+
+def period_starts(start_date, end_date, resolution):
+    """Start of every period overlapping ``[start_date, end_date]``."""
+    starts = []
+    current = period_start(start_date, resolution)
+    while current <= end_date:
+        starts.append(current)
+        current = period_end(current, resolution) + timedelta(days=1)
+    return starts
+
+
+def refresh_rollups(entries):
+    """Rebuild the weekly and monthly rollups of every period touched by written ``(source, target, date)`` rates."""
+    pivot = settings.RATE_ENGINE["PIVOT_CURRENCY"]
+    periods = set()
+    for source_code, target_code, valuation_date in entries:
+        if source_code != pivot:
+            continue
+        if isinstance(valuation_date, datetime):
+            valuation_date = valuation_date.date()
+        elif isinstance(valuation_date, str):
+            valuation_date = date.fromisoformat(valuation_date)
+        periods.update((target_code, resolution, period_start(valuation_date, resolution)) for resolution in ROLLUP_RESOLUTIONS)
+    if periods:
+        write_rollups(periods)
+
+
+def rebuild_rollups(target_codes, start_date, end_date, resolutions=ROLLUP_RESOLUTIONS):
+    """Rebuild the rollups of ``target_codes`` for every period overlapping ``[start_date, end_date]``."""
+    write_rollups({(code, resolution, start) for code in target_codes for resolution in resolutions for start in period_starts(start_date, end_date, resolution)})
+
+
+def write_rollups(periods):
+    """
+    Recompute ``(code, resolution, period_start)`` rollups from the stored daily pivot rates with one query
+    and upsert them. Periods left without any daily rate lose their rollup.
+    """
+    pivot = settings.RATE_ENGINE["PIVOT_CURRENCY"]
+    span_start = min(start for _, _, start in periods)
+    span_end = max(period_end(start, resolution) for _, resolution, start in periods)
+    codes = {code for code, _, _ in periods}
+
+    rates_by_period = defaultdict(list)
+    rows = (
+        CurrencyExchangeRate.objects.filter(source_currency__code=pivot, exchanged_currency__code__in=codes, valuation_date__range=[span_start, span_end])
+        .order_by("valuation_date")
+        .values_list("exchanged_currency__code", "valuation_date", "rate_value")
+    )
+    for code, valuation_date, rate_value in rows:
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (code, resolution, period_start(valuation_date, resolution))
+            if key in periods:
+                rates_by_period[key].append(rate_value)
+
+    currency_ids = load_currency_ids()
+    rollups = [
+        CurrencyExchangeRateRollup(
+            source_currency_id=currency_ids[pivot],
+            exchanged_currency_id=currency_ids[code],
+            resolution=resolution,
+            period_start=start,
+            open_value=rates[0],
+            high_value=max(rates),
+            low_value=min(rates),
+            close_value=rates[-1],
+            mean_value=(sum(rates) / len(rates)).quantize(ROLLUP_PLACES),
+            days=len(rates),
+        )
+        for (code, resolution, start), rates in rates_by_period.items()
+    ]
+    with transaction.atomic():
+        if rollups:
+            CurrencyExchangeRateRollup.objects.bulk_create(
+                rollups,
+                **upsert_options(CurrencyExchangeRateRollup, ["source_currency", "exchanged_currency", "resolution", "period_start"], ["open_value", "high_value", "low_value", "close_value", "mean_value", "days", "updated_at"]),
+            )
+        empty_periods = defaultdict(list)
+        for code, resolution, start in periods - rates_by_period.keys():
+            empty_periods[(code, resolution)].append(start)
+        for (code, resolution), starts in empty_periods.items():
+            CurrencyExchangeRateRollup.objects.filter(source_currency_id=currency_ids[pivot], exchanged_currency_id=currency_ids[code], resolution=resolution, period_start__in=starts).delete()
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+# Settings whose 'ALIAS' must be a cache every worker reaches for the feature to work across processes
+SHARED_CACHE_SETTINGS = {
+    "PROVIDER_QUOTA": "provider quotas are counted per process, so N workers may send N times the allowed requests",
+    "SINGLE_FLIGHT": "concurrent misses are only coalesced within each worker",
+    "RATE_CACHE": "workers don't share cached rates",
+    "CURRENCY_LIST_CACHE": "currency changes only invalidate the cached list of the process that made them",
+}
+
+
+def is_process_local(alias):
+    """Whether the cache ``alias`` lives inside the current process, so other workers can't see its entries, locks or counters."""
+    return isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
+
+
+def process_local_settings():
+    """``{setting name: consequence}`` of the settings in ``SHARED_CACHE_SETTINGS`` whose alias is per-process."""
+    return {name: consequence for name, consequence in SHARED_CACHE_SETTINGS.items() if is_process_local(getattr(settings, name).get("ALIAS", "default"))}
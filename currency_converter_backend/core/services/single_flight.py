@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+import uuid
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class FlightAbandoned(Exception):
+    """The leader of a call went away (e.g. its request was cancelled) before it had an outcome; retry the call."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent work on the same key so that it runs once.
+
+    Within a process the first caller of a key leads it and later callers wait on the leader's
+    future until it is resolved. ``concurrent.futures.Future`` is used rather than an asyncio one
+    so that callers on different threads and event loops (each sync request under WSGI runs its
+    own) can share it. Across processes the leader also takes a lock in the shared cache
+    ``SINGLE_FLIGHT['ALIAS']``; ``cache.add`` only succeeds for one caller, and the lock expires
+    after ``LOCK_TIMEOUT`` seconds should its holder die.
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.SINGLE_FLIGHT
+        self.alias = config.get("ALIAS", "default")
+        self.key_prefix = config.get("KEY_PREFIX", "flight")
+        self.lock_timeout = config.get("LOCK_TIMEOUT", 15)
+        self.wait_timeout = config.get("WAIT_TIMEOUT", 10)
+        self.poll_interval = config.get("POLL_INTERVAL", 0.05)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def claim(self, keys):
+        """
+        Split ``keys`` into ``(leading, following)``. The caller must ``resolve`` every leading key;
+        following keys map to the future of the call already in flight.
+        """
+        leading, following = [], {}
+        with self._lock:
+            for key in keys:
+                if key in self._calls:
+                    following[key] = self._calls[key]
+                else:
+                    self._calls[key] = Future()
+                    leading.append(key)
+        return leading, following
+
+    def resolve(self, outcomes):
+        """Hand ``{key: value | Exception}`` to the callers waiting on these keys and end their flights."""
+        with self._lock:
+            futures = {key: self._calls.pop(key) for key in outcomes if key in self._calls}
+        for key, future in futures.items():
+            if isinstance(outcomes[key], BaseException):
+                future.set_exception(outcomes[key])
+            else:
+                future.set_result(outcomes[key])
+
+    async def wait(self, following, timeout=None):
+        """``{key: value | Exception}`` of calls led by someone else; calls still running after ``timeout`` time out."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        waiters = {key: asyncio.wrap_future(future) for key, future in following.items()}
+        # asyncio.wait leaves unfinished futures running, cancelling them would cancel the leader's call for every follower
+        await asyncio.wait(waiters.values(), timeout=timeout)
+        outcomes = {}
+        for key, waiter in waiters.items():
+            if not waiter.done():
+                outcomes[key] = asyncio.TimeoutError(f"Timed out waiting for the in-flight fetch of {key}")
+            elif waiter.cancelled():
+                outcomes[key] = FlightAbandoned(f"The in-flight fetch of {key} was cancelled")
+            else:
+                outcomes[key] = waiter.exception() or waiter.result()
+        return outcomes
+
+    def lock_key(self, key):
+        return f"{self.key_prefix}:" + ":".join(str(part) for part in key)
+
+    async def aacquire(self, keys):
+        """Take the cross-worker locks of ``keys``. Returns ``(acquired, held_elsewhere)``."""
+        acquired, held_elsewhere = [], []
+        for key in keys:
+            try:
+                locked = await self.shared.aadd(self.lock_key(key), self._token, timeout=self.lock_timeout)
+            except Exception as e:
+                # Without the shared cache we still coalesce within this worker
+                logger.error(f"Error taking single-flight lock {self.lock_key(key)}: {e}")
+                locked = True
+            (acquired if locked else held_elsewhere).append(key)
+        return acquired, held_elsewhere
+
+    async def arelease(self, keys):
+        if not keys:
+            return
+        try:
+            await self.shared.adelete_many([self.lock_key(key) for key in keys])
+        except Exception as e:
+            logger.error(f"Error releasing {len(keys)} single-flight locks: {e}")
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Currency, CurrencyExchangeRate, Providers
+from core.services.currency_list_cache import currency_list_cache
+from core.services.exchange_rate_service import provider_registry
+from core.services.rate_cache import rate_cache
+from core.services.rate_store import refresh_rollups
+
+
+@receiver([post_save, post_delete], sender=CurrencyExchangeRate)
+def invalidate_rate_cache(sender, instance, **kwargs):
+    # Covers save_data's update_or_create, the admin and any other ORM write of a single row
+    rate_cache.invalidate(instance.source_currency.code, instance.exchanged_currency.code, instance.valuation_date)
+
+
+@receiver([post_save, post_delete], sender=CurrencyExchangeRate)
+def refresh_rate_rollups(sender, instance, **kwargs):
+    refresh_rollups([(instance.source_currency.code, instance.exchanged_currency.code, instance.valuation_date)])
+
+
+@receiver([post_save, post_delete], sender=Currency)
+def invalidate_currency_list_cache(sender, instance, **kwargs):
+    currency_list_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Providers)
+def refresh_provider_registry(sender, instance, **kwargs):
+    provider_registry.invalidate()
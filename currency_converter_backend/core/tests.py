@@ -1,3 +1,426 @@
-from django.test import TestCase
+import asyncio
+import io
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+import httpx
+import msgpack
+from django.conf import settings
+from django.core.cache import caches
+from django.test import AsyncClient, TestCase, override_settings
+
+from core.management.commands.async_load_historical_data import Command as HistoricalLoadCommand
+from core.models import BackfillCheckpoint, Currency, CurrencyExchangeRate, CurrencyExchangeRateRollup
+from core.services.currency_list_cache import currency_list_cache
+from core.services.currency_timeseries_service import CurrencyTimeseriesService
+from core.services.exchange_rate_service import CircuitBreaker, ProviderChain, ProviderUnavailableError, provider_registry
+from core.services.provider_http import provider_http
+from core.services.provider_quota import BATCH, INTERACTIVE, ProviderQuota, QuotaExceededError
+from core.services.rate_cache import rate_cache
+from core.services.rate_engine import RateEngine
+from core.services.single_flight import single_flight
+
+
+def create_pivot_rates(rates_by_code):
+    """Store ``{code: {valuation_date: rate}}`` as USD pivot rows, creating the currencies involved."""
+    currencies = {code: Currency.objects.create(code=code, name=code, symbol=code) for code in ["USD", *rates_by_code]}
+    for code, rates in rates_by_code.items():
+        for valuation_date, rate in rates.items():
+            CurrencyExchangeRate.objects.create(source_currency=currencies["USD"], exchanged_currency=currencies[code], valuation_date=valuation_date, rate_value=Decimal(rate))
+
+
+class FakeProvider:
+    """Answers with ``rates`` (or raises ``error``) after ``delay`` seconds and counts its calls."""
+
+    def __init__(self, rates=None, error=None, delay=0):
+        self.rates, self.error, self.delay = rates, error, delay
+        self.calls = 0
+
+    async def get_exchange_rates(self, source_currency, exchanged_currencies, valuation_date):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.rates
+
+
+class FakeRegistry:
+    """The part of ``ProviderRegistry`` the chain uses, over fixed providers without quotas."""
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    async def aproviders(self):
+        return dict(self.providers)
+
+    async def alimits(self, provider_name):
+        return {}
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        rate_cache.clear_local()
+
+    async def test_follower_takes_over_when_the_leader_is_cancelled(self):
+        leader_started, follower_waiting = asyncio.Event(), asyncio.Event()
+        fetches = []
+
+        async def fetch_pivot_rates(codes, valuation_date, provider_name):
+            fetches.append(codes)
+            if len(fetches) == 1:
+                leader_started.set()
+                await asyncio.Event().wait()  # The leader's client disconnects mid-fetch
+            return {code: Decimal("0.9") for code in codes}, dict.fromkeys(codes, "API"), {}
+
+        wait = single_flight.wait
+
+        async def spy_wait(following, timeout=None):
+            follower_waiting.set()
+            return await wait(following, timeout)
+
+        with patch.object(RateEngine, "afetch_pivot_rates", new=fetch_pivot_rates), patch.object(single_flight, "wait", new=spy_wait):
+            leader = asyncio.create_task(RateEngine.aresolve_pivot_rates(["EUR"], "2021-01-01", "CurrencyBeacon"))
+            await leader_started.wait()
+            follower = asyncio.create_task(RateEngine.aresolve_pivot_rates(["EUR"], "2021-01-01", "CurrencyBeacon"))
+            await follower_waiting.wait()
+            leader.cancel()
+            pivot_rates, origins, errors = await asyncio.wait_for(follower, 5)
+
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(pivot_rates, {"EUR": Decimal("0.9")})
+        self.assertEqual(origins, {"EUR": "API"})
+        self.assertEqual(errors, {})
+        self.assertEqual(fetches, [["EUR"], ["EUR"]])
+        self.assertEqual(single_flight.in_flight(), 0)
+
+
+@override_settings(HISTORICAL_LOAD={**settings.HISTORICAL_LOAD, "BACKOFF_BASE": 0, "BACKOFF_MAX": 0})
+class HistoricalLoadTests(TestCase):
+    fixtures = ["001_providers_list"]
+
+    def setUp(self):
+        for code in ["USD", "EUR", "GBP"]:
+            Currency.objects.create(code=code, name=code, symbol=code)
+
+    async def load(self, responses, start="2021-01-04", end="2021-01-06"):
+        """Run the backfill of EUR and GBP against canned provider responses; returns the command and the requested URLs."""
+        requests = []
+
+        def handler(request):
+            requests.append(request.url)
+            return responses.pop(0)
+
+        command = HistoricalLoadCommand(stdout=io.StringIO())
+        options = {"start": date.fromisoformat(start), "end": date.fromisoformat(end), "currencies": "EUR,GBP", "provider": "CurrencyBeacon", "ignore_checkpoint": False, "concurrency": 2, "rate": 0, "batch_size": 1000, "retries": 2}
+        with patch.object(provider_http, "get_async_client", new=lambda provider_name: httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+            await command.load_exchange_rates(options)
+        return command, requests
+
+    async def checkpoint(self):
+        return await BackfillCheckpoint.objects.afirst()
+
+    async def test_error_response_fails_the_window_instead_of_checkpointing_it(self):
+        unauthorized = httpx.Response(401, json={"success": False, "error": {"code": 401, "message": "Invalid API key"}})
+        command, requests = await self.load([unauthorized])
+
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(command.stats["failures"], 1)
+        self.assertEqual(await CurrencyExchangeRate.objects.acount(), 0)
+        self.assertIsNone(await self.checkpoint())
+
+    async def test_retries_and_checkpoints_days_without_rates(self):
+        rates = {"2021-01-04": {"EUR": 0.82, "GBP": 0.73}, "2021-01-05": {"EUR": 0.81, "GBP": 0.74}}
+        command, requests = await self.load([httpx.Response(503), httpx.Response(200, json={"response": rates})])
+
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(command.stats["retries"], 1)
+        self.assertEqual(command.stats["saved"], 4)
+        # 2021-01-06 has no rates, so it counts as done rather than holding the checkpoint back
+        self.assertEqual((await self.checkpoint()).completed_through, date(2021, 1, 6))
+
+    async def test_resume_reports_checkpoint_and_stored_days_separately(self):
+        await self.load([httpx.Response(200, json={"response": {"2021-01-04": {"EUR": 0.82, "GBP": 0.73}}})], end="2021-01-05")
+        command, requests = await self.load([httpx.Response(200, json={"response": {}})], start="2021-01-04", end="2021-01-07")
+
+        self.assertEqual(command.stats["checkpointed_days"], 2)
+        self.assertEqual(command.stats["stored_days"], 0)
+        self.assertIn("start_date=2021-01-06", str(requests[0]))
+        self.assertEqual((await self.checkpoint()).completed_through, date(2021, 1, 7))
+
+
+class TimeseriesGapTests(TestCase):
+    fixtures = ["001_providers_list"]
+
+    def setUp(self):
+        rate_cache.clear_local()
+        caches[rate_cache.alias].clear()
+        provider_registry.invalidate()
+        create_pivot_rates({"EUR": {date(2021, 1, 4): "0.82", date(2021, 1, 5): "0.81", date(2021, 1, 6): "0.80"}, "GBP": {date(2021, 1, 4): "0.73", date(2021, 1, 6): "0.75"}})
+
+    async def stream(self, answer):
+        """Stream USD -> EUR, GBP over 2021-01-04..06 with the provider answering ``answer(symbols, start, end)``; returns the points and the calls made."""
+        calls = []
+
+        async def fetch_plan_from_api(provider_instance, base_currency_code, fetch_plan):
+            calls.extend(fetch_plan)
+            return [answer(*call) for call in fetch_plan]
+
+        with patch.object(CurrencyTimeseriesService, "fetch_plan_from_api", new=fetch_plan_from_api):
+            result = await CurrencyTimeseriesService.stream_currency_timeseries("USD", ["EUR", "GBP"], date(2021, 1, 4), date(2021, 1, 6))
+            points = [point async for point in result["points"]]
+        return points, calls
+
+    async def test_stream_fetches_only_the_codes_missing_on_a_day(self):
+        points, calls = await self.stream(lambda symbols, start, end: {"rates": {date(2021, 1, 5): {"GBP": Decimal("0.74")}}})
+
+        self.assertEqual(calls, [(["GBP"], date(2021, 1, 5), date(2021, 1, 5))])
+        self.assertIn(("GBP", date(2021, 1, 5), Decimal("0.740000")), points)
+        self.assertEqual(len(points), 6)
+
+    async def test_days_without_rates_are_not_fetched_again(self):
+        _, first_calls = await self.stream(lambda symbols, start, end: {"rates": {}})
+        points, calls = await self.stream(lambda symbols, start, end: {"rates": {}})
+
+        self.assertEqual(len(first_calls), 1)
+        self.assertEqual(calls, [])
+        self.assertNotIn(date(2021, 1, 5), [valuation_date for code, valuation_date, rate in points if code == "GBP"])
+
+
+class TimeseriesFormatTests(TestCase):
+    def setUp(self):
+        rate_cache.clear_local()
+        create_pivot_rates({"EUR": {date(2021, 1, 4): "0.82", date(2021, 1, 5): "0.81"}, "GBP": {date(2021, 1, 4): "0.73", date(2021, 1, 5): "0.74"}})
+
+    async def get(self, accept):
+        query = {"base_currency": "USD", "to_currencies": "EUR,GBP", "start_date": "2021-01-04", "end_date": "2021-01-05"}
+        return await AsyncClient().get("/api/v1/multiple_currency_timeseries/", query, headers={"Accept": accept})
+
+    async def test_columnar_json_lists_the_dates_once(self):
+        response = await self.get("application/vnd.mycurrency.columnar+json")
+
+        self.assertEqual(response["Content-Type"], "application/vnd.mycurrency.columnar+json")
+        self.assertIn("Accept", response["Vary"])
+        self.assertEqual(
+            response.json(),
+            {"base": "USD", "resolution": "daily", "dates": ["2021-01-04", "2021-01-05"], "values": {"EUR": [0.82, 0.81], "GBP": [0.73, 0.74]}, "errors": {}},
+        )
+
+    async def test_msgpack_carries_the_columnar_payload(self):
+        columnar = (await self.get("application/vnd.mycurrency.columnar+json")).json()
+        response = await self.get("application/msgpack")
+
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), columnar)
+
+    async def test_default_json_keeps_the_rows_shape(self):
+        response = await self.get("application/json")
+
+        self.assertEqual(response.json()["EUR"], {"rates": [{"valuation_date": "2021-01-04", "rate_value": "0.820000"}, {"valuation_date": "2021-01-05", "rate_value": "0.810000"}]})
+
+
+class RollupTests(TestCase):
+    fixtures = ["001_providers_list"]
+
+    def setUp(self):
+        rate_cache.clear_local()
+        caches[rate_cache.alias].clear()
+        provider_registry.invalidate()
+        # Monday 2021-01-04 to Sunday 2021-01-10, without Wednesday
+        self.rates = {date(2021, 1, day): rate for day, rate in [(4, "0.82"), (5, "0.84"), (7, "0.80"), (8, "0.83"), (9, "0.81"), (10, "0.85")]}
+        create_pivot_rates({"EUR": self.rates})
+
+    async def weekly(self, answer):
+        calls = []
+
+        async def fetch_plan_from_api(provider_instance, base_currency_code, fetch_plan):
+            calls.extend(fetch_plan)
+            return [answer(*call) for call in fetch_plan]
+
+        with patch.object(CurrencyTimeseriesService, "fetch_plan_from_api", new=fetch_plan_from_api):
+            frame = await CurrencyTimeseriesService.load_currency_timeseries("USD", ["EUR"], date(2021, 1, 4), date(2021, 1, 10), CurrencyExchangeRateRollup.WEEKLY)
+        return frame, calls
+
+    def test_saved_rates_roll_up_into_their_week(self):
+        rollup = CurrencyExchangeRateRollup.objects.get(exchanged_currency__code="EUR", resolution=CurrencyExchangeRateRollup.WEEKLY)
+
+        self.assertEqual(rollup.period_start, date(2021, 1, 4))
+        self.assertEqual((rollup.open_value, rollup.high_value, rollup.low_value, rollup.close_value), (Decimal("0.82"), Decimal("0.85"), Decimal("0.80"), Decimal("0.85")))
+        self.assertEqual(rollup.mean_value, Decimal("0.825000"))
+        self.assertEqual(rollup.days, 6)
+
+    async def test_week_with_a_gap_is_filled_and_rebuilt_once(self):
+        frame, calls = await self.weekly(lambda symbols, start, end: {"rates": {date(2021, 1, 6): {"EUR": Decimal("0.79")}}})
+
+        self.assertEqual(calls, [(["EUR"], date(2021, 1, 6), date(2021, 1, 6))])
+        self.assertEqual(frame["dates"], [date(2021, 1, 4)])
+        self.assertEqual(frame["values"], {"EUR": [Decimal("0.850000")]})
+        rollup = await CurrencyExchangeRateRollup.objects.aget(exchanged_currency__code="EUR", resolution=CurrencyExchangeRateRollup.WEEKLY)
+        self.assertEqual((rollup.low_value, rollup.days), (Decimal("0.79"), 7))
+
+        _, calls = await self.weekly(lambda symbols, start, end: {"rates": {}})
+        self.assertEqual(calls, [])
+
+
+class CurrencyListTests(TestCase):
+    def setUp(self):
+        currency_list_cache.invalidate()
+        Currency.objects.create(code="USD", name="US Dollar", symbol="$")
+
+    async def get(self, **headers):
+        return await AsyncClient().get("/api/v1/currency_list/", headers=headers)
+
+    async def test_revalidation_with_the_etag_is_answered_with_304_from_the_cached_entry(self):
+        first = await self.get()
+        with patch.object(currency_list_cache, "build", side_effect=AssertionError("The list was rebuilt")):
+            second = await self.get(If_None_Match=first["ETag"])
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second.content, b"")
+
+    async def test_currency_changes_change_the_etag(self):
+        first = await self.get()
+        await Currency.objects.acreate(code="EUR", name="Euro", symbol="€")
+        second = await self.get(If_None_Match=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual([currency["code"] for currency in second.json()], ["USD", "EUR"])
+
+
+class CircuitBreakerTests(TestCase):
+    fixtures = ["001_providers_list"]
+
+    def chain(self, providers):
+        return ProviderChain(FakeRegistry(providers), config={"TIMEOUT": 0.2, "FAILURE_THRESHOLD": 2, "SLOW_CALL_THRESHOLD": 1, "RESET_TIMEOUT": 60}, hedging={"ENABLED": False})
+
+    def test_consecutive_failures_open_the_circuit_and_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker("CurrencyBeacon", failure_threshold=2, slow_call_threshold=1, reset_timeout=60)
+        breaker.record(0.1, ValueError("bad response"))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(0.1, ValueError("bad response"))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        breaker.reset_timeout = 0
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_a_slow_success_counts_as_a_failure(self):
+        breaker = CircuitBreaker("CurrencyBeacon", failure_threshold=1, slow_call_threshold=1, reset_timeout=60)
+        breaker.record(2)
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.last_error, "slow call (2.00s)")
+
+    async def test_chain_fails_over_and_then_skips_the_open_circuit(self):
+        failing, backup = FakeProvider(error=httpx.ConnectError("refused")), FakeProvider(rates={"EUR": Decimal("0.9")})
+        chain = self.chain([("CurrencyBeacon", failing), ("Backup", backup)])
+        for _ in range(3):
+            rates = await chain.get_exchange_rates("USD", ["EUR"], date(2021, 1, 4), "CurrencyBeacon")
+
+        self.assertEqual(rates, {"EUR": Decimal("0.9")})
+        self.assertEqual((failing.calls, backup.calls), (2, 3))
+        self.assertEqual(chain.breaker("CurrencyBeacon").state, CircuitBreaker.OPEN)
+
+    async def test_every_provider_failing_raises_with_the_reasons(self):
+        chain = self.chain([("CurrencyBeacon", FakeProvider(error=httpx.ConnectError("refused"))), ("Backup", FakeProvider(delay=5))])
+        with self.assertRaisesMessage(ProviderUnavailableError, "CurrencyBeacon: ConnectError; Backup: timed out after 0.2s"):
+            await chain.get_exchange_rates("USD", ["EUR"], date(2021, 1, 4), "CurrencyBeacon")
+
+    async def test_the_mock_provider_is_never_registered(self):
+        provider_registry.invalidate()
+
+        self.assertEqual(list(await provider_registry.aproviders()), ["CurrencyBeacon"])
+
+
+class HedgingTests(TestCase):
+    def chain(self, providers, max_hedge_ratio=1):
+        chain = ProviderChain(
+            FakeRegistry(providers),
+            config={"TIMEOUT": 1, "FAILURE_THRESHOLD": 5, "SLOW_CALL_THRESHOLD": 1, "RESET_TIMEOUT": 60},
+            hedging={"ENABLED": True, "PERCENTILE": 50, "MIN_SAMPLES": 1, "MIN_DELAY": 0.01, "MAX_HEDGE_RATIO": max_hedge_ratio, "MAX_HEDGE_BURST": 1},
+        )
+        for name, _ in providers:
+            chain.record_latency(name, 0.01)
+        return chain
+
+    async def test_a_slow_provider_is_hedged_and_the_faster_answer_wins(self):
+        slow, fast = FakeProvider(rates={"EUR": Decimal("0.8")}, delay=0.5), FakeProvider(rates={"EUR": Decimal("0.9")})
+        chain = self.chain([("CurrencyBeacon", slow), ("Backup", fast)])
+        rates = await chain.get_exchange_rates("USD", ["EUR"], date(2021, 1, 4), "CurrencyBeacon")
+
+        self.assertEqual(rates, {"EUR": Decimal("0.9")})
+        self.assertEqual(chain.hedge_budget.snapshot(), {"primary_calls": 1, "hedges": 1, "hedge_wins": 1, "credits": 0.0})
+
+    async def test_no_budget_is_spent_without_a_provider_to_hedge_to(self):
+        chain = self.chain([("CurrencyBeacon", FakeProvider(rates={"EUR": Decimal("0.8")}, delay=0.05))])
+        await chain.get_exchange_rates("USD", ["EUR"], date(2021, 1, 4), "CurrencyBeacon")
+
+        self.assertEqual(chain.hedge_budget.snapshot(), {"primary_calls": 1, "hedges": 0, "hedge_wins": 0, "credits": 1.0})
+
+    async def test_out_of_budget_the_next_provider_is_kept_for_failover(self):
+        failing, backup = FakeProvider(error=httpx.ConnectError("refused"), delay=0.05), FakeProvider(rates={"EUR": Decimal("0.9")})
+        chain = self.chain([("CurrencyBeacon", failing), ("Backup", backup)], max_hedge_ratio=0)
+        rates = await chain.get_exchange_rates("USD", ["EUR"], date(2021, 1, 4), "CurrencyBeacon")
+
+        self.assertEqual(rates, {"EUR": Decimal("0.9")})
+        self.assertEqual(backup.calls, 1)
+        self.assertEqual(chain.hedge_budget.hedges, 0)
+
+
+class ProviderQuotaTests(TestCase):
+    def setUp(self):
+        self.quota = ProviderQuota({"ALIAS": "shared", "KEY_PREFIX": "test-quota", "INTERACTIVE_RESERVE": 0.2, "INTERACTIVE_MAX_WAIT": 1, "BATCH_MAX_WAIT": 0})
+        self.quota.shared.clear()
+
+    def test_batch_callers_leave_the_interactive_reserve(self):
+        self.assertEqual(self.quota.allowance(10, INTERACTIVE), 10)
+        self.assertEqual(self.quota.allowance(10, BATCH), 8)
+        # The reserve rounds up to a whole request, so a tiny quota is interactive-only
+        self.assertEqual(self.quota.allowance(1, BATCH), 0)
+
+    def test_low_rates_are_counted_over_windows_long_enough_for_the_reserve(self):
+        self.assertEqual(self.quota.rate_window(10), (1.0, 10))
+        self.assertEqual(self.quota.rate_window(1), (5.0, 5))
+        window, requests = self.quota.rate_window(1)
+        self.assertEqual(self.quota.allowance(requests, BATCH), 4)
+
+    async def test_daily_quota_is_split_between_batch_and_interactive_callers(self):
+        outcomes = [await self.quota.try_acquire("CurrencyBeacon", None, 5, BATCH) for _ in range(5)]
+        self.assertEqual([retry_in is None for retry_in, reason in outcomes], [True, True, True, True, False])
+        self.assertEqual(outcomes[-1][1], "daily quota used up")
+
+        await self.quota.acquire("CurrencyBeacon", daily_quota=5, priority=INTERACTIVE)
+        self.assertEqual(await self.quota.usage("CurrencyBeacon"), 5)
+        with self.assertRaises(QuotaExceededError):
+            await self.quota.acquire("CurrencyBeacon", daily_quota=5, priority=INTERACTIVE)
+
+
+class PivotDerivationTests(TestCase):
+    def test_cross_rate_divides_the_target_leg_by_the_source_leg(self):
+        pivot_rates = {"EUR": Decimal("0.8"), "GBP": Decimal("0.7")}
+
+        self.assertEqual(RateEngine.cross_rate(pivot_rates, "EUR", "GBP"), Decimal("0.875000"))
+        self.assertEqual(RateEngine.cross_rate(pivot_rates, "USD", "EUR"), Decimal("0.800000"))
+        self.assertEqual(RateEngine.cross_rate(pivot_rates, "GBP", "USD"), Decimal("1.428571"))
+        self.assertEqual(RateEngine.cross_rate({}, "CHF", "CHF"), Decimal("1.000000"))
+
+    def test_cross_rate_is_none_without_both_legs(self):
+        self.assertIsNone(RateEngine.cross_rate({"EUR": Decimal("0.8")}, "EUR", "CHF"))
+        self.assertIsNone(RateEngine.cross_rate({"EUR": Decimal("0")}, "EUR", "USD"))
+
+    def test_only_non_pivot_codes_are_stored(self):
+        self.assertEqual(RateEngine.pivot_codes("USD", "GBP", "EUR", "GBP"), ["EUR", "GBP"])
+
+    def test_pairs_are_derived_from_stored_pivot_rows(self):
+        create_pivot_rates({"EUR": {date(2021, 1, 4): "0.8"}, "GBP": {date(2021, 1, 4): "0.7"}})
+        pivot_rates = RateEngine.load_pivot_rates(RateEngine.pivot_codes("EUR", "GBP"), date(2021, 1, 4))
+
+        self.assertEqual(RateEngine.cross_rate(pivot_rates, "GBP", "EUR"), Decimal("1.142857"))
@@ -11,6 +11,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from core.lifespan import with_lifespan
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'currency_converter_backend.settings')
 
-application = get_asgi_application()
+# Close the shared provider connection pools on ASGI lifespan shutdown
+application = with_lifespan(get_asgi_application())
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # CORS Middleware should be at the top
+    'core.middleware.CompressionMiddleware',  # Brotli or gzip; above anything that reads the response body
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -156,4 +157,138 @@ LOGGING = {
 # Service Provider Configuration
 CURRENT_PROVIDER = 'CurrencyBeacon'
 CURRENCY_BEACON_BASE_URL = "https://api.currencybeacon.com/"
-CURRENCY_BEACON_API_KEY = "XXX"
\ No newline at end of file
+CURRENCY_BEACON_API_KEY = "XXX"
+
+# Cache settings
+# "shared" holds what every worker must see (cached rates, single-flight locks, quota counters). Set REDIS_URL in
+# production; without it each process falls back to its own in-memory cache and nothing is actually shared
+REDIS_URL = os.getenv('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'currency-converter',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'currency-converter-shared',
+    },
+}
+
+# Serialized currency list served by currency_list, invalidated on Currency changes
+CURRENCY_LIST_CACHE = {
+    'ALIAS': 'shared',
+    'KEY': 'currency_list',
+    'LOCAL_TIMEOUT': 60,  # Seconds an entry lives while "shared" is per-process, since other processes' changes can't invalidate it
+}
+
+# Exchange rate cache: in-process LRU in front of the shared Django cache above
+RATE_CACHE = {
+    'ALIAS': 'shared',
+    'KEY_PREFIX': 'rate',
+    'LOCAL_MAX_ENTRIES': 10000,
+    'TODAY_TTL': 300,  # Seconds for today's (still changing) rates
+    'HISTORICAL_TTL': 86400,  # Seconds a past day's rate stays in the shared tier
+    'LOCAL_TTL': 60,  # Seconds an entry may live in the per-process tier, and in the shared one while it is per-process too
+    'EMPTY_TTL': 86400,  # Seconds before a past day the provider had no rate for is asked for again
+}
+
+# Concurrent provider fetches for cache misses in convert_multiple_currency
+CONVERSION_FETCH = {
+    'MAX_CONCURRENCY': 8,  # Upstream calls in flight per request
+    'DEADLINE': 10,  # Seconds before unfinished targets are reported as timed out
+    'SYMBOLS_PER_CALL': 50,  # Target currencies requested per upstream rate-vector call
+}
+
+# Concurrent misses of the same rate share one provider call and one write. The locks live in the
+# "shared" cache, so coalescing across workers needs REDIS_URL; without it each worker only coalesces its own requests
+SINGLE_FLIGHT = {
+    'ALIAS': 'shared',
+    'KEY_PREFIX': 'rate-flight',
+    'LOCK_TIMEOUT': 15,  # Seconds before the lock of a worker that died is released; keep above CONVERSION_FETCH['DEADLINE']
+    'WAIT_TIMEOUT': 10,  # Seconds a request waits for another's fetch before giving up (in-process) or fetching itself (cross-worker)
+    'POLL_INTERVAL': 0.05,  # Seconds between checks of the shared rate cache while another worker fetches
+}
+
+# Shared keep-alive HTTP pools used to talk to rate providers (one pool per provider and worker)
+PROVIDER_HTTP = {
+    'MAX_CONNECTIONS': 20,
+    'MAX_KEEPALIVE_CONNECTIONS': 10,
+    'KEEPALIVE_EXPIRY': 30,  # Seconds an idle connection is kept open
+    'TIMEOUT': 10,  # Seconds for read/write/pool acquisition
+    'CONNECT_TIMEOUT': 5,
+    'PROVIDERS': {
+        # Per-provider overrides, e.g. 'CurrencyBeacon': {'MAX_CONNECTIONS': 50},
+    },
+}
+
+# Active providers are built once per process and reused; admin changes reload them immediately in this process
+PROVIDER_REGISTRY = {
+    'REFRESH_INTERVAL': 60,  # Seconds before other processes reload the Providers table
+    'CLASSES': {
+        # Extra CurrencyProvider implementations by provider_name, e.g. 'OpenExchangeRates': 'myapp.providers.OpenExchangeRates',
+    },
+}
+
+# Conversions try the requested provider, then the other active ones by Providers.priority
+PROVIDER_FAILOVER = {
+    'TIMEOUT': 4,  # Seconds per provider call, so a failover still fits in CONVERSION_FETCH['DEADLINE']
+    'TIMEOUTS': {
+        # Per-provider overrides, e.g. 'CurrencyBeacon': 3,
+    },
+    'FAILURE_THRESHOLD': 5,  # Consecutive failures (or slow calls) that open a provider's circuit
+    'SLOW_CALL_THRESHOLD': 3,  # Seconds after which a successful call still counts as a failure
+    'RESET_TIMEOUT': 30,  # Seconds an open circuit skips the provider before a half-open probe
+}
+
+# Upstream allowance per provider (Providers.requests_per_second / daily_quota), counted in the "shared" cache
+# so conversions, timeseries and the historical backfill share it; needs REDIS_URL to hold across processes
+PROVIDER_QUOTA = {
+    'ALIAS': 'shared',
+    'KEY_PREFIX': 'provider-quota',
+    'INTERACTIVE_RESERVE': 0.2,  # Share of every window and day the backfill may not use
+    'INTERACTIVE_MAX_WAIT': 1,  # Seconds a conversion waits for a slot before moving to the next provider
+    'BATCH_MAX_WAIT': None,  # Seconds a backfill request waits for a slot; None waits as long as it takes
+    'DAILY_POLL_INTERVAL': 60,  # Seconds between checks while a provider's daily quota is used up
+}
+
+# Optional hedging: a provider call slower than its usual latency is duplicated to the next provider of the chain
+PROVIDER_HEDGING = {
+    'ENABLED': False,
+    'PERCENTILE': 95,  # Hedge once a call has run longer than this percentile of the provider's recent latencies
+    'MIN_SAMPLES': 50,  # Latencies to observe before a provider is hedged at all
+    'LATENCY_WINDOW': 500,  # Recent successful calls the percentile is computed over
+    'MIN_DELAY': 0.05,  # Seconds; never hedge sooner than this
+    'MAX_HEDGE_RATIO': 0.05,  # Hedged calls as a share of provider calls, to protect upstream quotas
+    'MAX_HEDGE_BURST': 10,  # Unused hedge allowance that can be saved up for a slow spell
+}
+
+# Rates are stored against a single pivot currency; every other pair is derived on demand
+RATE_ENGINE = {
+    'PIVOT_CURRENCY': 'USD',
+}
+
+# async_load_historical_data defaults (overridable with --start/--concurrency/--rate/--batch-size/--retries)
+HISTORICAL_LOAD = {
+    'DEFAULT_START': '2024-09-01',  # Overridable with --start
+    'CONCURRENCY': 8,
+    'REQUESTS_PER_SECOND': 5,
+    'MAX_RETRIES': 4,
+    'BATCH_SIZE': 1000,  # Rates written per bulk upsert
+    'BACKOFF_BASE': 0.5,  # Seconds; doubled on every retry
+    'BACKOFF_MAX': 30,
+}
+
+# Streaming JSON responses (?stream=1 on currency_list and multiple_currency_timeseries)
+STREAMING = {
+    'CHUNK_SIZE': 2000,  # Rows fetched from the database per query/cursor round-trip
+    'FLUSH_ITEMS': 500,  # JSON items written to the client per chunk
+}
+
+# Cache-Control of rate responses (conversion and timeseries)
+HTTP_CACHE = {
+    'PAST_MAX_AGE': 31536000,  # Seconds; past-date rates never change, sent with "immutable"
+    'TODAY_MAX_AGE': 60,  # Seconds for responses that include today's rate
+}
@@ -38,9 +38,13 @@ const MultipleCurrencyChart = () => {
                 to_currencies: selectedCurrencies, // Send selected currencies
                 start_date: startDate.format('YYYY-MM-DD'),
                 end_date: endDate.format('YYYY-MM-DD'),
+                max_points: 500, // Long ranges come back as weekly or monthly points
+            }, {
+                // Columnar payload: the dates once, plus one aligned value array per currency
+                headers: { Accept: 'application/vnd.mycurrency.columnar+json' },
             });
-            setCurrencyData(response.data); // Update this to reflect the correct structure
-            setDates(Object.keys(response.data)); // Get keys if you still need dates separately
+            setCurrencyData(response.data.values || {});
+            setDates(response.data.dates || []);
         } catch (error) {
             console.error('Error fetching currency data:', error);
         } finally {
@@ -58,13 +62,11 @@ const MultipleCurrencyChart = () => {
 
     const createChartData = () => {
         return selectedCurrencies.map(currency => {
-            const rates = currencyData[currency]?.rates || [];
-            const dataPoints = rates.map(rate => parseFloat(rate.rate_value)); // Convert rate values to float
-            const datesArray = rates.map(rate => rate.valuation_date); // Extract valuation dates
-            
+            const values = currencyData[currency] || [];
+
             return {
-                x: datesArray, // Use extracted dates for the x-axis
-                y: dataPoints, // Use data points for the y-axis
+                x: dates, // Shared valuation dates for the x-axis
+                y: values, // Rates aligned to the dates, null where a day has no rate
                 type: 'scatter',
                 mode: 'lines+markers',
                 marker: { size: 8 },